@@ -1,10 +1,22 @@
 from flask import Flask, request, jsonify
 import requests
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date as date_type
 from flask_cors import CORS
 import logging
+import os
+import sys
 from functools import wraps
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service_client import get_client, fan_out
+from circuit_breaker import CircuitOpenError
+from master_directory import master_directory
+from outbox import Outbox
+from slot_search import SlotIndex, find_alternatives, rank_key
+from health_monitor import HealthMonitor, http_check
+from availability_mask import AvailabilityMask, TICK_MINUTES
+from idempotency import IdempotencyStore, IDEMPOTENCY_HEADER, idempotent
+
 app = Flask(__name__)
 
 # Настройка логирования
@@ -14,21 +26,69 @@ logger = logging.getLogger(__name__)
 # Настраиваем CORS для всех доменов
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# URL сервисов
-SERVICES = {
-    'master': 'http://localhost:5001',
-    'confirmation': 'http://localhost:5003',
-    'user': 'http://localhost:5000',
-    'history': 'http://localhost:5004',
-    'sync': 'ws://localhost:5005'
+# Клиенты сервисов с общими пулами соединений
+master_client = get_client('master')
+confirmation_client = get_client('confirmation')
+history_client = get_client('history')
+
+# Автоматические выключатели: при недоступной зависимости отвечаем 503 сразу, не дожидаясь таймаута
+circuit_breakers = {
+    'master_service': master_client.enable_circuit_breaker(),
+    'confirmation_service': confirmation_client.enable_circuit_breaker(),
+    'history_service': history_client.enable_circuit_breaker()
 }
 
+# Фоновая проверка зависимостей, /health отвечает из памяти
+health_monitor = HealthMonitor({
+    'master_service': http_check(master_client),
+    'confirmation_service': http_check(confirmation_client),
+    'history_service': http_check(history_client)
+}).start()
+
+# Максимальное количество слотов в одном пакетном бронировании
+MAX_BATCH_SIZE = 50
+
+# Сколько альтернативных вариантов предлагать и на сколько дней вперед искать
+ALTERNATIVES_COUNT = 3
+ALTERNATIVES_SEARCH_DAYS = 7
+
+# Окно (минуты), в котором режим "любой мастер" ищет замену, если точное время занято у всех
+ANY_MASTER_WINDOW = 120
+
+# Ответы /book и /quick_book по Idempotency-Key: повтор клиента или прокси не бронирует второй раз
+idempotency_store = IdempotencyStore()
+
+# Очередь побочных эффектов после бронирования (история, уведомления)
+outbox = Outbox(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'outbox.db'))
+
+@app.before_request
+def start_outbox_worker():
+    outbox.start()
+
+def is_valid_slot_format(date, time):
+    """Дата 'YYYY-MM-DD' и время 'HH:MM' в том виде, в каком их принимает
+    Master Service и хранят расписания ('2025-1-5' и '9:00' не подходят)"""
+    try:
+        return (date_type.fromisoformat(date).isoformat() == date
+                and datetime.strptime(time, '%H:%M').strftime('%H:%M') == time)
+    except (TypeError, ValueError):
+        return False
+
 # Декоратор для обработки ошибок
 def handle_errors(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         try:
             return f(*args, **kwargs)
+        except CircuitOpenError as e:
+            logger.warning(f"Circuit open: {e.name}, retry after {e.retry_after}s")
+            response = jsonify({
+                'error': f'{e} - повторите попытку позже',
+                'service': e.name,
+                'retry_after': e.retry_after
+            })
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response, 503
         except requests.exceptions.ConnectionError:
             logger.error("Connection error with external service")
             return jsonify({'error': 'Нет соединения с одним из сервисов'}), 500
@@ -53,32 +113,11 @@ def index():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Проверка здоровья сервиса и зависимостей"""
-    dependencies = {}
-    
-    try:
-        # Проверяем Master Service
-        master_res = requests.get(f"{SERVICES['master']}/", timeout=3)
-        dependencies['master_service'] = 'healthy' if master_res.status_code == 200 else 'unhealthy'
-    except:
-        dependencies['master_service'] = 'unreachable'
-    
-    try:
-        # Проверяем Confirmation Service
-        conf_res = requests.get(f"{SERVICES['confirmation']}/", timeout=3)
-        dependencies['confirmation_service'] = 'healthy' if conf_res.status_code == 200 else 'unhealthy'
-    except:
-        dependencies['confirmation_service'] = 'unreachable'
-    
-    all_healthy = all(status == 'healthy' for status in dependencies.values())
-    
-    return jsonify({
-        'status': 'healthy' if all_healthy else 'degraded',
-        'timestamp': datetime.utcnow().isoformat(),
-        'dependencies': dependencies
-    })
+    """Проверка здоровья сервиса и зависимостей (по данным фоновых проверок)"""
+    return jsonify(health_monitor.snapshot())
 
 @app.route('/book', methods=['POST', 'OPTIONS'])
+@idempotent(idempotency_store)
 @handle_errors
 def book():
     """Основной метод бронирования"""
@@ -93,27 +132,40 @@ def book():
     master_id = data.get('master_id')
     date = data.get('date')
     time = data.get('time')
+    # Режим "любой мастер": master_id='any' или any_master=true
+    any_master = bool(data.get('any_master')) or master_id == 'any'
     
     # Валидация входных данных
-    if not all([user_id, master_id, date, time]):
+    if not all([user_id, date, time]) or not (master_id or any_master):
         return jsonify({'error': 'Не все обязательные параметры указаны'}), 400
     
     # Проверяем валидность даты
-    try:
-        datetime.strptime(date, '%Y-%m-%d')
-        datetime.strptime(time, '%H:%M')
-    except ValueError:
+    if not is_valid_slot_format(date, time):
         return jsonify({'error': 'Неверный формат даты или времени'}), 400
     
+    if any_master:
+        try:
+            window = int(data.get('window', ANY_MASTER_WINDOW))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Неверное окно поиска'}), 400
+        logger.info(f"Бронирование у любого мастера: user={user_id}, date={date}, time={time}")
+        return book_any_master(user_id, date, time, window)
+    
     logger.info(f"Бронирование: user={user_id}, master={master_id}, date={date}, time={time}")
     
+    # Информация о мастере и его расписание не зависят друг от друга - запрашиваем параллельно
+    results = fan_out({
+        'master_info': (get_master_info, master_id),
+        'schedule': (get_master_schedule, master_id, date)
+    })
+    master_info = results['master_info']
+    schedule = results['schedule']
+    
     # Проверяем доступность мастера
-    master_info = get_master_info(master_id)
     if not master_info:
         return jsonify({'error': 'Мастер не найден'}), 404
     
-    # Получаем расписание мастера
-    schedule = get_master_schedule(master_id, date)
+    # Проверяем расписание мастера
     if not schedule:
         return jsonify({'error': 'Ошибка получения расписания'}), 500
     
@@ -124,44 +176,142 @@ def book():
         return process_booking(user_id, master_id, date, time, master_info)
     else:
         # Ищем альтернативные варианты
-        return handle_alternative_slots(master_id, date, time, available_times, master_info)
+        return handle_alternative_slots(
+            master_id, date, time, available_times, master_info,
+            suggest_other_masters=bool(data.get('suggest_other_masters'))
+        )
 
 def get_master_info(master_id):
     """Получение информации о мастере"""
-    try:
-        response = requests.get(f"{SERVICES['master']}/masters", timeout=5)
-        if response.status_code == 200:
-            masters = response.json()
-            master_name = masters.get(str(master_id)) or f'Мастер #{master_id}'
-            return {'id': master_id, 'name': master_name}
-    except Exception as e:
-        logger.error(f"Error getting master info: {e}")
+    master = master_directory.get(master_id)
+    if master:
+        return {'id': master_id, 'name': master.get('name') or f'Мастер #{master_id}'}
     return None
 
 def get_master_schedule(master_id, date):
     """Получение расписания мастера"""
     try:
-        response = requests.get(f"{SERVICES['master']}/schedule/{master_id}/{date}", timeout=5)
+        response = master_client.get(f"/schedule/{master_id}/{date}")
         if response.status_code == 200:
             return response.json()
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error getting master schedule: {e}")
     return None
 
+def get_master_schedule_range(master_id, date_from, date_to):
+    """Получение расписания мастера на диапазон дат одним запросом (в компактном формате)"""
+    try:
+        response = master_client.get(
+            f"/schedule_range/{master_id}",
+            params={'from': date_from, 'to': date_to, 'format': 'bitmask'}
+        )
+        if response.status_code == 200:
+            return decode_schedule_range(response.json())
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting master schedule range: {e}")
+    return None
+
+def decode_schedule_range(data):
+    """Разворачивает битовые маски /schedule_range в списки доступных времен"""
+    if data.get('tick_minutes') != TICK_MINUTES:
+        raise ValueError(f"Шаг сетки Master Service ({data.get('tick_minutes')}) не совпадает с {TICK_MINUTES}")
+    data['days'] = {
+        day: {'available_times': AvailabilityMask.from_compact(mask, data['slot_ticks']).available_times()}
+        for day, mask in data.get('days', {}).items()
+    }
+    return data
+
+def get_masters_availability_range(date_from, date_to, exclude=None):
+    """Доступность всех мастеров (кроме exclude) на диапазон дат одним запросом"""
+    try:
+        response = master_client.get(
+            "/availability_range",
+            params={'from': date_from, 'to': date_to, 'exclude': exclude, 'format': 'bitmask'}
+        )
+        if response.status_code == 200:
+            data = response.json()
+            return {
+                int(m_id): decode_schedule_range(
+                    dict(info, tick_minutes=data.get('tick_minutes'), slot_ticks=data.get('slot_ticks'))
+                )
+                for m_id, info in data.get('masters', {}).items()
+            }
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting masters availability range: {e}")
+    return None
+
+def get_free_masters(date, time, window=0):
+    """Свободные на дату и время мастера одним запросом к Master Service"""
+    try:
+        response = master_client.get('/availability', params={'date': date, 'time': time, 'window': window})
+        if response.status_code == 200:
+            return response.json().get('masters', [])
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error getting free masters: {e}")
+    return None
+
+def book_any_master(user_id, date, time, window):
+    """Бронирование у первого мастера, свободного в выбранное время"""
+    free_masters = get_free_masters(date, time, window)
+    if free_masters is None:
+        return jsonify({'error': 'Ошибка поиска свободных мастеров'}), 500
+    
+    for candidate in free_masters:
+        if not candidate.get('exact') or candidate.get('time') != time:
+            continue
+        
+        master_id = candidate['master_id']
+        booking_result = book_slot(master_id, date, time, user_id)
+        if booking_result.get('conflict'):
+            # Слот заняли после запроса доступности - пробуем следующего мастера
+            continue
+        
+        master_info = {'id': master_id, 'name': candidate.get('master_name') or f'Мастер #{master_id}'}
+        return complete_booking(booking_result, user_id, master_id, date, time, master_info)
+    
+    suggestions = [{
+        'date': date,
+        'time': candidate['time'],
+        'day_offset': 0,
+        'difference': candidate['difference'],
+        'master_id': candidate['master_id'],
+        'master_name': candidate.get('master_name')
+    } for candidate in free_masters if not candidate.get('exact')][:ALTERNATIVES_COUNT]
+    
+    return jsonify({
+        'success': False,
+        'error': 'Нет свободных мастеров на выбранное время',
+        'suggestions': suggestions,
+        'message': 'Попробуйте ближайшее время' if suggestions else 'Пожалуйста, выберите другую дату'
+    }), 409
+
 def process_booking(user_id, master_id, date, time, master_info):
     """Обработка успешного бронирования"""
     # Бронируем слот
     booking_result = book_slot(master_id, date, time, user_id)
-    
+    return complete_booking(booking_result, user_id, master_id, date, time, master_info)
+
+def complete_booking(booking_result, user_id, master_id, date, time, master_info):
+    """Подтверждение забронированного слота или ответ о неудаче бронирования"""
     if booking_result.get('success'):
         # Подтверждаем бронирование
-        confirmation = confirm_booking(user_id, master_id, date, time, master_info['name'])
+        try:
+            confirmation = confirm_booking(user_id, master_id, date, time, master_info['name'])
+        except CircuitOpenError:
+            cancel_booking(master_id, date, time)
+            raise
         
         if confirmation.get('success'):
-            # Сохраняем в историю
-            save_to_history(user_id, master_id, master_info['name'], date, time)
-            
-            # Отправляем уведомление в реальном времени
+            # Сеанс в историю передает Confirmation Service (событие booking.confirmed),
+            # уведомление отправляется асинхронно через outbox
             notify_booking_created(user_id, master_id, date, time)
             
             logger.info(f"Бронирование успешно: booking_id={confirmation.get('booking_id')}")
@@ -171,32 +321,42 @@ def process_booking(user_id, master_id, date, time, master_info):
                 'message': 'Запись успешно создана',
                 'booking_id': confirmation.get('booking_id'),
                 'booking': confirmation.get('booking'),
+                'master_id': master_id,
                 'master_name': master_info['name']
             })
         else:
             # Отменяем бронирование если подтверждение не удалось
             cancel_booking(master_id, date, time)
             return jsonify({'error': 'Ошибка подтверждения записи'}), 500
+    elif booking_result.get('conflict'):
+        return jsonify({
+            'success': False,
+            'error': 'Выбранное время уже занято',
+            'master_name': master_info['name']
+        }), 409
     else:
         return jsonify({'error': 'Не удалось забронировать слот'}), 500
 
 def book_slot(master_id, date, time, user_id):
     """Бронирование слота у мастера"""
     try:
-        response = requests.post(
-            f"{SERVICES['master']}/book_slot/{master_id}/{date}/{time}",
-            json={'client_id': user_id},
-            timeout=5
+        response = master_client.post(
+            f"/book_slot/{master_id}/{date}/{time}",
+            json={'client_id': user_id}
         )
-        return response.json() if response.status_code == 200 else {'success': False}
+        # 409 - слот уже занят (конфликт разрешила база Master Service)
+        return response.json() if response.status_code in (200, 409) else {'success': False}
+    except CircuitOpenError:
+        raise
     except:
         return {'success': False}
 
 def confirm_booking(user_id, master_id, date, time, master_name):
-    """Подтверждение бронирования"""
+    """Подтверждение бронирования; Idempotency-Key клиента передается дальше"""
+    idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
     try:
-        response = requests.post(
-            f"{SERVICES['confirmation']}/confirm",
+        response = confirmation_client.post(
+            "/confirm",
             json={
                 'user_id': user_id,
                 'master_id': master_id,
@@ -204,126 +364,353 @@ def confirm_booking(user_id, master_id, date, time, master_name):
                 'time': time,
                 'master_name': master_name
             },
-            timeout=5
+            headers={IDEMPOTENCY_HEADER: idempotency_key} if idempotency_key else None
         )
         return response.json() if response.status_code == 200 else {'success': False}
+    except CircuitOpenError:
+        raise
     except:
         return {'success': False}
 
-def save_to_history(user_id, master_id, master_name, date, time):
-    """Сохранение в историю сеансов"""
-    try:
-        requests.post(
-            f"{SERVICES['history']}/add_session",
-            json={
-                'user_id': user_id,
-                'master_id': master_id,
-                'master_name': master_name,
-                'date': date,
-                'time': time,
-                'status': 'pending'
-            },
-            timeout=3
-        )
-    except:
-        logger.warning("Не удалось сохранить в историю")
+def deliver_history_session(payload):
+    """Доставка сеанса в History Service (вызывается воркером outbox)"""
+    response = history_client.post("/add_session", json=payload, timeout=3)
+    # 400 означает, что сеанс уже есть в истории - повторять не нужно
+    if response.status_code >= 500:
+        raise RuntimeError(f"History Service ответил {response.status_code}")
 
 def notify_booking_created(user_id, master_id, date, time):
-    """Уведомление о создании бронирования"""
+    """Постановка уведомления о создании бронирования в очередь"""
     try:
-        # В реальном приложении здесь будет WebSocket
-        logger.info(f"Booking created notification: user={user_id}, master={master_id}")
-    except:
-        pass
+        outbox.add('booking.created', {
+            'user_id': user_id,
+            'master_id': master_id,
+            'date': date,
+            'time': time
+        })
+    except Exception as e:
+        logger.warning(f"Не удалось поставить уведомление в очередь: {e}")
+
+def deliver_booking_notification(payload):
+    """Уведомление о создании бронирования (вызывается воркером outbox)"""
+    # В реальном приложении здесь будет WebSocket
+    logger.info(f"Booking created notification: user={payload['user_id']}, master={payload['master_id']}")
+
+def deliver_history_sessions(payload):
+    """Пакетная доставка сеансов в History Service (вызывается воркером outbox)"""
+    response = history_client.post("/add_sessions", json=payload, timeout=3)
+    if response.status_code >= 500:
+        raise RuntimeError(f"History Service ответил {response.status_code}")
+
+# history.* больше не ставятся в очередь; обработчики доставляют события, оставшиеся в outbox
+outbox.register('history.add_session', deliver_history_session)
+outbox.register('history.add_sessions', deliver_history_sessions)
+outbox.register('booking.created', deliver_booking_notification)
 
 def cancel_booking(master_id, date, time):
     """Отмена бронирования"""
     try:
-        requests.delete(
-            f"{SERVICES['master']}/free_slot/{master_id}/{date}/{time}",
-            timeout=3
+        # Компенсирующий вызов выполняется даже при разомкнутой цепи
+        master_client.delete(
+            f"/free_slot/{master_id}/{date}/{time}",
+            timeout=3,
+            use_breaker=False
         )
     except:
         logger.warning("Не удалось отменить бронирование")
 
-def handle_alternative_slots(master_id, date, time, available_times, master_info):
+@app.route('/book_batch', methods=['POST', 'OPTIONS'])
+@handle_errors
+def book_batch():
+    """Пакетное бронирование нескольких слотов (семьи, группы)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    data = request.json
+    if not data:
+        return jsonify({'error': 'Нет данных'}), 400
+    
+    items = data.get('items')
+    mode = data.get('mode', 'all_or_nothing')
+    
+    if not items or not isinstance(items, list):
+        return jsonify({'error': 'Не указан список слотов'}), 400
+    
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Не более {MAX_BATCH_SIZE} слотов за один запрос'}), 400
+    
+    if mode not in ('all_or_nothing', 'best_effort'):
+        return jsonify({'error': 'Режим должен быть all_or_nothing или best_effort'}), 400
+    
+    # Валидация входных данных
+    slots = []
+    for index, item in enumerate(items):
+        if not all([item.get('user_id'), item.get('master_id'), item.get('date'), item.get('time')]):
+            return jsonify({'error': f'Не все обязательные параметры указаны (слот {index})'}), 400
+        if not is_valid_slot_format(item['date'], item['time']):
+            return jsonify({'error': f'Неверный формат даты или времени (слот {index})'}), 400
+        try:
+            slots.append({
+                'index': index,
+                'user_id': int(item['user_id']),
+                'master_id': int(item['master_id']),
+                'date': item['date'],
+                'time': item['time']
+            })
+        except ValueError:
+            return jsonify({'error': f'Неверный формат данных (слот {index})'}), 400
+    
+    logger.info(f"Пакетное бронирование: {len(slots)} слотов, mode={mode}")
+    
+    # Информация о мастерах - параллельно, по одному запросу на мастера (обычно из кэша)
+    masters = fan_out({master_id: (get_master_info, master_id) for master_id in {s['master_id'] for s in slots}})
+    
+    results = [dict(slot, success=False) for slot in slots]
+    pending = []
+    for slot in slots:
+        if masters.get(slot['master_id']):
+            pending.append(slot)
+        else:
+            results[slot['index']]['error'] = 'Мастер не найден'
+    
+    if mode == 'all_or_nothing' and len(pending) != len(slots):
+        return jsonify({'success': False, 'mode': mode, 'results': results}), 404
+    
+    # Бронируем слоты у мастеров одним запросом (Master Service группирует по мастеру и дате)
+    booked = []
+    if pending:
+        booking_result = book_slots(pending, mode)
+        if booking_result is None:
+            return jsonify({'error': 'Не удалось забронировать слоты'}), 500
+        
+        for slot, result in zip(pending, booking_result.get('results', [])):
+            if result.get('success'):
+                booked.append(slot)
+            else:
+                results[slot['index']]['error'] = result.get('error', 'Не удалось забронировать слот')
+    
+    if mode == 'all_or_nothing' and len(booked) != len(slots):
+        return jsonify({'success': False, 'mode': mode, 'results': results}), 409
+    
+    # Подтверждаем забронированные слоты одним запросом
+    confirmed = []
+    if booked:
+        try:
+            confirmation = confirm_bookings([
+                dict(slot, master_name=masters[slot['master_id']]['name']) for slot in booked
+            ], mode)
+        except CircuitOpenError:
+            release_slots(booked)
+            raise
+        confirmation_results = (confirmation or {}).get('results') or [{}] * len(booked)
+        
+        failed = []
+        for slot, result in zip(booked, confirmation_results):
+            if result.get('success'):
+                results[slot['index']].update(
+                    success=True,
+                    booking_id=result.get('booking_id'),
+                    booking=result.get('booking'),
+                    master_name=masters[slot['master_id']]['name']
+                )
+                confirmed.append(slot)
+            else:
+                results[slot['index']]['error'] = result.get('error', 'Ошибка подтверждения записи')
+                failed.append(slot)
+        
+        # Освобождаем слоты, которые не удалось подтвердить
+        if failed:
+            release_slots(failed)
+        
+        if mode == 'all_or_nothing' and failed:
+            return jsonify({'success': False, 'mode': mode, 'results': results}), 500
+    
+    # Уведомления - асинхронно через outbox, сеансы в историю передает Confirmation Service
+    if confirmed:
+        notify_batch_created(confirmed)
+    
+    logger.info(f"Пакетное бронирование: подтверждено {len(confirmed)} из {len(slots)}")
+    
+    return jsonify({
+        'success': len(confirmed) == len(slots),
+        'mode': mode,
+        'booked': len(confirmed),
+        'failed': len(slots) - len(confirmed),
+        'results': results
+    }), 200 if confirmed else 409
+
+def book_slots(slots, mode):
+    """Пакетное бронирование слотов у мастеров"""
+    try:
+        response = master_client.post(
+            "/book_slots",
+            json={
+                'slots': [{
+                    'master_id': s['master_id'],
+                    'date': s['date'],
+                    'time': s['time'],
+                    'client_id': s['user_id']
+                } for s in slots],
+                'mode': mode
+            }
+        )
+        if response.status_code in (200, 409):
+            return response.json()
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error booking slots: {e}")
+    return None
+
+def confirm_bookings(slots, mode):
+    """Пакетное подтверждение бронирований"""
+    try:
+        response = confirmation_client.post(
+            "/confirm_batch",
+            json={
+                'bookings': [{
+                    'user_id': s['user_id'],
+                    'master_id': s['master_id'],
+                    'date': s['date'],
+                    'time': s['time'],
+                    'master_name': s['master_name']
+                } for s in slots],
+                'mode': mode
+            }
+        )
+        if response.status_code in (200, 409):
+            return response.json()
+    except CircuitOpenError:
+        raise
+    except Exception as e:
+        logger.error(f"Error confirming bookings: {e}")
+    return None
+
+def release_slots(slots):
+    """Пакетная отмена бронирования слотов"""
+    try:
+        master_client.post(
+            "/free_slots",
+            json={'slots': [{
+                'master_id': s['master_id'],
+                'date': s['date'],
+                'time': s['time']
+            } for s in slots]},
+            timeout=3,
+            use_breaker=False
+        )
+    except:
+        logger.warning("Не удалось отменить бронирование слотов")
+
+def notify_batch_created(slots):
+    """Постановка уведомлений о пакете бронирований в очередь"""
+    try:
+        outbox.add_many('booking.created', [{
+            'user_id': s['user_id'],
+            'master_id': s['master_id'],
+            'date': s['date'],
+            'time': s['time']
+        } for s in slots])
+    except Exception as e:
+        logger.warning(f"Не удалось поставить пакет в очередь: {e}")
+
+def handle_alternative_slots(master_id, date, time, available_times, master_info, suggest_other_masters=False):
     """Обработка альтернативных вариантов при занятом слоте"""
     try:
-        target_dt = datetime.strptime(f'{date} {time}', '%Y-%m-%d %H:%M')
+        # Ближайшие свободные слоты в запрошенный день (в обе стороны от времени)
+        index = SlotIndex({date: available_times})
+        suggestions = find_alternatives(index, date, time, ALTERNATIVES_COUNT, max_days=0)
         
-        # Фильтруем доступные слоты
-        available_slots = []
-        for slot_time in available_times:
-            slot_dt = datetime.strptime(f'{date} {slot_time}', '%Y-%m-%d %H:%M')
-            if slot_dt > target_dt:  # Только слоты после запрошенного времени
-                available_slots.append({
-                    'time': slot_time,
-                    'datetime': slot_dt,
-                    'difference': (slot_dt - target_dt).total_seconds() / 60  # разница в минутах
+        # Если в этот день вариантов мало - одним запросом берем следующие дни
+        if len(suggestions) < ALTERNATIVES_COUNT:
+            start = datetime.strptime(date, '%Y-%m-%d')
+            schedule_range = get_master_schedule_range(
+                master_id,
+                (start + timedelta(days=1)).strftime('%Y-%m-%d'),
+                (start + timedelta(days=ALTERNATIVES_SEARCH_DAYS)).strftime('%Y-%m-%d')
+            )
+            if schedule_range:
+                index.add_days({
+                    day: info.get('available_times', [])
+                    for day, info in schedule_range.get('days', {}).items()
                 })
+                suggestions = find_alternatives(index, date, time, ALTERNATIVES_COUNT, ALTERNATIVES_SEARCH_DAYS)
+        
+        for suggestion in suggestions:
+            suggestion['master_id'] = master_id
+            suggestion['master_name'] = master_info['name']
+        
+        response = {
+            'success': False,
+            'suggestions': suggestions,
+            'master_name': master_info['name']
+        }
         
-        # Сортируем по близости к запрошенному времени
-        available_slots.sort(key=lambda x: x['difference'])
+        if suggest_other_masters:
+            response['other_masters'] = find_other_masters_alternatives(master_id, date, time)
         
-        # Берем 3 ближайших варианта
-        alternatives = [slot['time'] for slot in available_slots[:3]]
+        alternatives = [s['time'] for s in suggestions if s['day_offset'] == 0]
         
         if alternatives:
-            return jsonify({
-                'success': False,
+            response.update({
                 'error': 'Выбранное время занято',
                 'alternative_times': alternatives,
-                'message': f'Доступные альтернативные времена: {", ".join(alternatives)}',
-                'master_name': master_info['name']
-            }), 409
+                'message': f'Доступные альтернативные времена: {", ".join(alternatives)}'
+            })
+        elif suggestions:
+            # По одной (лучшей) записи на каждую дату
+            best_by_date = {}
+            for s in suggestions:
+                best_by_date.setdefault(s['date'], s)
+            response.update({
+                'error': 'Нет доступных слотов в этот день',
+                'alternative_dates': [{
+                    'date': s['date'],
+                    'time': s['time'],
+                    'day_of_week': datetime.strptime(s['date'], '%Y-%m-%d').weekday(),
+                    'formatted': format_date_for_display(s['date'])
+                } for s in best_by_date.values()],
+                'message': 'Попробуйте другие даты'
+            })
         else:
-            # Проверяем доступность на другие даты
-            next_dates = get_next_available_dates(master_id, date, time)
-            
-            if next_dates:
-                return jsonify({
-                    'success': False,
-                    'error': 'Нет доступных слотов в этот день',
-                    'alternative_dates': next_dates,
-                    'message': 'Попробуйте другие даты',
-                    'master_name': master_info['name']
-                }), 409
-            else:
-                return jsonify({
-                    'success': False,
-                    'error': 'Нет доступных слотов',
-                    'message': 'Пожалуйста, выберите другую дату или мастера',
-                    'master_name': master_info['name']
-                }), 409
+            response.update({
+                'error': 'Нет доступных слотов',
+                'message': 'Пожалуйста, выберите другую дату или мастера'
+            })
+        
+        return jsonify(response), 409
                 
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error handling alternatives: {e}")
         return jsonify({'error': 'Ошибка поиска альтернативных вариантов'}), 500
 
-def get_next_available_dates(master_id, original_date, original_time):
-    """Поиск доступных дат в будущем"""
+def find_other_masters_alternatives(master_id, date, time):
+    """Ближайшие свободные слоты у других мастеров, ранжированные по близости"""
+    date_to = (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=ALTERNATIVES_SEARCH_DAYS)).strftime('%Y-%m-%d')
     try:
-        original_dt = datetime.strptime(original_date, '%Y-%m-%d')
-        alternative_dates = []
-        
-        # Проверяем следующие 7 дней
-        for i in range(1, 8):
-            check_date = (original_dt + timedelta(days=i)).strftime('%Y-%m-%d')
-            
-            schedule = get_master_schedule(master_id, check_date)
-            if schedule and original_time in schedule.get('available_times', []):
-                alternative_dates.append({
-                    'date': check_date,
-                    'day_of_week': (original_dt.weekday() + i) % 7,
-                    'formatted': format_date_for_display(check_date)
-                })
-            
-            if len(alternative_dates) >= 3:
-                break
-        
-        return alternative_dates
-    except:
+        # Один запрос на всех мастеров: число мастеров не влияет на число вызовов и пул fan_out
+        schedules = get_masters_availability_range(date, date_to, exclude=master_id)
+    except Exception as e:
+        logger.error(f"Error getting other masters: {e}")
+        return []
+    if not schedules:
         return []
+    
+    suggestions = []
+    for m_id, schedule_range in schedules.items():
+        index = SlotIndex({
+            day: info.get('available_times', [])
+            for day, info in schedule_range.get('days', {}).items()
+        })
+        for suggestion in find_alternatives(index, date, time, ALTERNATIVES_COUNT, ALTERNATIVES_SEARCH_DAYS):
+            suggestion['master_id'] = m_id
+            suggestion['master_name'] = schedule_range.get('master_name') or f'Мастер #{m_id}'
+            suggestions.append(suggestion)
+    
+    suggestions.sort(key=rank_key)
+    return suggestions[:ALTERNATIVES_COUNT]
 
 def format_date_for_display(date_string):
     """Форматирование даты для отображения"""
@@ -355,11 +742,14 @@ def check_availability(master_id, date, time):
             'time': time,
             'master_name': schedule.get('master_name', f'Мастер #{master_id}')
         })
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error checking availability: {e}")
         return jsonify({'error': 'Ошибка проверки доступности'}), 500
 
 @app.route('/quick_book', methods=['POST'])
+@idempotent(idempotency_store)
 @handle_errors
 def quick_book():
     """Быстрое бронирование по рекомендации"""
@@ -373,8 +763,18 @@ def quick_book():
     if not all([user_id, master_id, date, time]):
         return jsonify({'error': 'Не все параметры указаны'}), 400
     
+    if not is_valid_slot_format(date, time):
+        return jsonify({'error': 'Неверный формат даты или времени'}), 400
+    
+    # Расписание и информацию о мастере запрашиваем параллельно
+    results = fan_out({
+        'schedule': (get_master_schedule, master_id, date),
+        'master_info': (get_master_info, master_id)
+    })
+    schedule = results['schedule']
+    master_info = results['master_info']
+    
     # Проверяем доступность
-    schedule = get_master_schedule(master_id, date)
     if not schedule:
         return jsonify({'error': 'Ошибка проверки расписания'}), 500
     
@@ -382,7 +782,6 @@ def quick_book():
         return jsonify({'error': 'Время уже занято'}), 409
     
     # Выполняем бронирование
-    master_info = get_master_info(master_id)
     if not master_info:
         return jsonify({'error': 'Мастер не найден'}), 404
     
@@ -396,12 +795,22 @@ def get_master_availability(master_id):
         today = datetime.now().date()
         availability = {}
         
-        # Проверяем следующие 5 дней
+        # Получаем следующие 5 дней одним запросом, параллельно с информацией о мастере
+        date_from = today.strftime('%Y-%m-%d')
+        date_to = (today + timedelta(days=4)).strftime('%Y-%m-%d')
+        results = fan_out({
+            'schedule_range': (get_master_schedule_range, master_id, date_from, date_to),
+            'master_info': (get_master_info, master_id)
+        })
+        schedule_range = results['schedule_range']
+        master_info = results['master_info']
+        days = schedule_range.get('days', {}) if schedule_range else {}
+        
         for i in range(5):
             check_date = today + timedelta(days=i)
             date_str = check_date.strftime('%Y-%m-%d')
             
-            schedule = get_master_schedule(master_id, date_str)
+            schedule = days.get(date_str)
             if schedule:
                 availability[date_str] = {
                     'available': len(schedule.get('available_times', [])) > 0,
@@ -410,8 +819,6 @@ def get_master_availability(master_id):
                     'formatted_date': format_date_for_display(date_str)
                 }
         
-        master_info = get_master_info(master_id)
-        
         return jsonify({
             'success': True,
             'master_id': master_id,
@@ -419,10 +826,30 @@ def get_master_availability(master_id):
             'availability': availability,
             'next_available': get_next_available_date(availability)
         })
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error getting master availability: {e}")
         return jsonify({'error': 'Ошибка получения доступности'}), 500
 
+@app.route('/circuit_breakers', methods=['GET'])
+def circuit_breakers_state():
+    """Состояние автоматических выключателей зависимостей"""
+    return jsonify({
+        'success': True,
+        'circuit_breakers': {name: breaker.snapshot() for name, breaker in circuit_breakers.items()}
+    })
+
+@app.route('/outbox_stats', methods=['GET'])
+def outbox_stats():
+    """Глубина очереди побочных эффектов и счетчики доставки"""
+    return jsonify({'success': True, 'outbox': outbox.stats()})
+
+@app.route('/idempotency_stats', methods=['GET'])
+def idempotency_stats():
+    """Счетчики хранилища ответов по Idempotency-Key"""
+    return jsonify({'success': True, 'idempotency': idempotency_store.stats()})
+
 def get_next_available_date(availability):
     """Получение следующей доступной даты"""
     for date, info in sorted(availability.items()):
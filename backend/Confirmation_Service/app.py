@@ -1,36 +1,138 @@
 from flask import Flask, request, jsonify
 import requests
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_cors import CORS
 from datetime import datetime
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service_client import get_client, fan_out
+from master_directory import master_directory
+from cache import LRUCache
+from sqlite_engine import create_sqlite_db
+from typed_columns import DayNumber, MinuteOfDay, migrate_typed_columns
+from health_monitor import HealthMonitor, http_check
+from pagination import keyset_listing
+from idempotency import IdempotencyStore, idempotent
+from event_stream import EventPublisher
+from serialization import RowMapper, isoformat, json_response
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(os.path.dirname(__file__), 'bookings.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+db = create_sqlite_db(app, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bookings.db'))
 
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-USER_URL = 'http://localhost:5000'
-MASTER_URL = 'http://localhost:5001'
-HISTORY_URL = 'http://localhost:5004'
+user_client = get_client('user')
+master_client = get_client('master')
+history_client = get_client('history')
+
+# Профили пользователей: User Service сбрасывает запись через /invalidate_user при изменении,
+# TTL ограничивает устаревание, если уведомление потерялось
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 300))
+user_cache = LRUCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+
+# Ответы /confirm по Idempotency-Key: повтор отдается без поиска дубля в БД
+idempotency_store = IdempotencyStore()
 
 class Booking(db.Model):
     __tablename__ = 'bookings'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, nullable=False, index=True)
+    user_id = db.Column(db.Integer, nullable=False)
     user_name = db.Column(db.String(100))
     master_id = db.Column(db.Integer, nullable=False)
     master_name = db.Column(db.String(100))
-    date = db.Column(db.String(20), nullable=False)
-    time = db.Column(db.String(10), nullable=False)
+    date = db.Column(DayNumber, nullable=False)
+    time = db.Column(MinuteOfDay, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Индексы под выборки: записи пользователя, записи мастера, все записи по дате
+    __table_args__ = (
+        db.Index('ix_bookings_user_date_time', 'user_id', 'date', 'time'),
+        db.Index('ix_bookings_master_date_time', 'master_id', 'date', 'time'),
+        db.Index('ix_bookings_date_time', 'date', 'time'),
+    )
+
+class BookingCounter(db.Model):
+    """Число записей: всего ('all'), у мастера ('master:<id>') и у пользователя ('user:<id>').
+    Поддерживается событиями модели Booking в той же транзакции, что и сама запись"""
+    __tablename__ = 'booking_counters'
+    key = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+def booking_counter_keys(booking):
+    return ('all', f'master:{booking.master_id}', f'user:{booking.user_id}')
+
+def change_booking_counters(connection, booking, delta):
+    table = BookingCounter.__table__
+    for key in booking_counter_keys(booking):
+        stmt = sqlite_insert(table).values(key=key, count=delta)
+        connection.execute(stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={'count': table.c.count + delta}
+        ))
+
+def deliver_booking_events(stream_id, events):
+    """Пачка событий в History Service; уже принятые seq он пропускает сам"""
+    response = history_client.post(
+        '/ingest_booking_events', json={'stream': stream_id, 'events': events}, timeout=5
+    )
+    if response.status_code != 200:
+        raise RuntimeError(f'History Service ответил {response.status_code}')
+
+# Единственный источник сеансов для истории: booking.confirmed и booking.cancelled
+# записываются в той же транзакции, что и сама запись, и доставляются по порядку
+booking_events = EventPublisher(app, db, 'booking_events', deliver_booking_events)
+
+def booking_event_payload(booking):
+    return {
+        'booking_id': booking.id,
+        'user_id': booking.user_id,
+        'user_name': booking.user_name,
+        'master_id': booking.master_id,
+        'master_name': booking.master_name,
+        'date': booking.date,
+        'time': booking.time
+    }
+
+@event.listens_for(Booking, 'after_insert')
+def booking_inserted(mapper, connection, booking):
+    change_booking_counters(connection, booking, 1)
+    booking_events.emit(connection, 'booking.confirmed', booking_event_payload(booking))
+
+@event.listens_for(Booking, 'after_delete')
+def booking_deleted(mapper, connection, booking):
+    change_booking_counters(connection, booking, -1)
+    booking_events.emit(connection, 'booking.cancelled', booking_event_payload(booking))
+
+def rebuild_booking_counters():
+    """Пересчитывает счетчики по таблице записей (первый запуск после обновления)"""
+    counts = {'all': db.session.query(func.count(Booking.id)).scalar()}
+    for column, prefix in ((Booking.master_id, 'master'), (Booking.user_id, 'user')):
+        for value, count in db.session.query(column, func.count(Booking.id)).group_by(column):
+            counts[f'{prefix}:{value}'] = count
+    db.session.query(BookingCounter).delete()
+    db.session.add_all([BookingCounter(key=key, count=count) for key, count in counts.items()])
+    db.session.commit()
+
+def get_booking_count(key):
+    count = db.session.execute(select(BookingCounter.count).where(BookingCounter.key == key)).scalar()
+    return count or 0
+
 def init_database():
     with app.app_context():
         try:
             db.create_all()
+            migrate_typed_columns(db, Booking)
+            # Заменен составным индексом (user_id, date, time)
+            db.session.execute(text('DROP INDEX IF EXISTS ix_bookings_user_id'))
+            db.session.commit()
+            for index in Booking.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
+            if db.session.get(BookingCounter, 'all') is None:
+                rebuild_booking_counters()
             print("✅ Таблицы созданы/проверены")
         except Exception as e:
             print(f"❌ Ошибка при инициализации базы данных: {e}")
@@ -39,12 +141,72 @@ def init_database():
 
 with app.app_context():
     init_database()
+booking_events.start()
+
+def check_database():
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+
+# Фоновая проверка БД и зависимостей, /health отвечает из памяти
+health_monitor = HealthMonitor({
+    'database': check_database,
+    'user_service': http_check(user_client),
+    'master_service': http_check(master_client),
+    'history_service': http_check(history_client)
+}).start()
 
 @app.route('/')
 def index():
     return jsonify({'service': 'Confirmation Service', 'status': 'running'})
 
+def get_user_name(user_id):
+    """Имя пользователя или None, если пользователь не найден"""
+    profile = get_user_profile(user_id)
+    if profile is None:
+        return None
+    return profile.get('name') or f'Пользователь #{user_id}'
+
+def get_user_profile(user_id):
+    """Профиль пользователя из кэша или User Service; отсутствие не кэшируется,
+    чтобы только что зарегистрированный пользователь был виден сразу"""
+    # Ключ кэша - int, как в /invalidate_user: user_id из JSON может прийти строкой
+    user_id = int(user_id)
+    
+    def load():
+        user_res = user_client.get(f'/user/{user_id}')
+        if user_res.status_code != 200:
+            return None
+        data = user_res.json()
+        return {'id': user_id, 'name': data.get('name'), 'role': data.get('role')}
+    
+    return user_cache.get_or_load(user_id, load, cache_none=False)
+
+# Строки списков записей: только нужные столбцы, без объектов ORM
+booking_rows = RowMapper(
+    'id', 'user_id', ('user', 'user_name'), 'master_id', ('master', 'master_name'),
+    'date', 'time', ('created_at', 'created_at', isoformat)
+)
+master_booking_rows = RowMapper(
+    'id', 'user_id', ('user', 'user_name'),
+    ('client_id', 'user_id'),  # Для совместимости с фронтендом
+    'master_id', ('master', 'master_name'), 'date', 'time'
+)
+
+def serialize_booking(booking):
+    return {
+        'id': booking.id,
+        'user_id': booking.user_id,
+        'user': booking.user_name,
+        'master_id': booking.master_id,
+        'master': booking.master_name,
+        'date': booking.date,
+        'time': booking.time,
+        'created_at': booking.created_at.isoformat() if booking.created_at else None
+    }
+
 @app.route('/confirm', methods=['POST', 'OPTIONS'])
+@idempotent(idempotency_store)
 def confirm():
     if request.method == 'OPTIONS':
         return '', 200
@@ -62,24 +224,18 @@ def confirm():
         if not all([user_id, master_id, date, time]):
             return jsonify({'error': 'Не все параметры указаны'}), 400
 
-        # Получаем информацию о пользователе
-        user_res = requests.get(f'{USER_URL}/user/{user_id}', timeout=5)
-        if user_res.status_code != 200:
+        try:
+            user_id = int(user_id)
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Неверный user_id'}), 400
+
+        # Получаем имя пользователя (из кэша профилей, при промахе - из User Service)
+        user_name = get_user_name(user_id)
+        if user_name is None:
             return jsonify({'error': 'Пользователь не найден'}), 404
-        
-        user = user_res.json()
-        user_name = user.get('name', f'Пользователь #{user_id}')
 
-        # Получаем информацию о мастере
-        try:
-            master_res = requests.get(f'{MASTER_URL}/masters', timeout=5)
-            if master_res.status_code == 200:
-                masters = master_res.json()
-                master_name = masters.get(str(master_id), f'Мастер #{master_id}')
-            else:
-                master_name = f'Мастер #{master_id}'
-        except:
-            master_name = f'Мастер #{master_id}'
+        # Получаем информацию о мастере (из кэша с перепроверкой)
+        master_name = master_directory.get_name(master_id, f'Мастер #{master_id}')
 
         # Проверяем нет ли уже такой записи у этого пользователя
         existing_booking = Booking.query.filter_by(
@@ -102,37 +258,15 @@ def confirm():
             time=time
         )
         
+        # Сеанс попадет в историю через событие booking.confirmed
         db.session.add(booking)
         db.session.commit()
 
-        # Добавляем сеанс в историю
-        try:
-            history_data = {
-                'user_id': user_id,
-                'user_name': user_name,
-                'master_id': master_id,
-                'master_name': master_name,
-                'date': date,
-                'time': time
-            }
-            requests.post(f'{HISTORY_URL}/add_session', json=history_data, timeout=5)
-        except:
-            print("⚠ Не удалось добавить сеанс в историю")
-
         return jsonify({
             'success': True,
             'message': 'Запись подтверждена',
             'booking_id': booking.id,
-            'booking': {
-                'id': booking.id,
-                'user_id': booking.user_id,
-                'user': booking.user_name,
-                'master_id': booking.master_id,
-                'master': booking.master_name,
-                'date': booking.date,
-                'time': booking.time,
-                'created_at': booking.created_at.isoformat() if booking.created_at else None
-            }
+            'booking': serialize_booking(booking)
         })
         
     except requests.exceptions.ConnectionError:
@@ -141,54 +275,155 @@ def confirm():
         db.session.rollback()
         return jsonify({'error': f'Внутренняя ошибка сервера: {str(e)}'}), 500
 
+def existing_bookings_query(user_ids, dates):
+    """Существующие записи пользователей на даты - одним запросом"""
+    return Booking.query.with_entities(
+        Booking.user_id, Booking.master_id, Booking.date, Booking.time
+    ).filter(
+        Booking.user_id.in_(user_ids),
+        Booking.date.in_(dates)
+    )
+
+@app.route('/confirm_batch', methods=['POST', 'OPTIONS'])
+def confirm_batch():
+    """Пакетное подтверждение записей одной транзакцией"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        data = request.json or {}
+        items = data.get('bookings') or []
+        mode = data.get('mode', 'all_or_nothing')
+        
+        if not items:
+            return jsonify({'error': 'Нет данных'}), 400
+        
+        try:
+            items = [dict(item, user_id=int(item['user_id'])) if item.get('user_id') else item for item in items]
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Неверный user_id'}), 400
+        
+        # Имена пользователей запрашиваем параллельно, по одному запросу на пользователя
+        user_ids = {item.get('user_id') for item in items}
+        user_names = fan_out({user_id: (get_user_name, user_id) for user_id in user_ids})
+        
+        existing = {
+            (row.user_id, row.master_id, row.date, row.time)
+            for row in existing_bookings_query(user_ids, {item.get('date') for item in items}).all()
+        }
+        
+        results = [None] * len(items)
+        to_create = []
+        for index, item in enumerate(items):
+            key = (item.get('user_id'), item.get('master_id'), item.get('date'), item.get('time'))
+            error = None
+            if not all(key):
+                error = 'Не все параметры указаны'
+            elif not user_names.get(item['user_id']):
+                error = 'Пользователь не найден'
+            elif key in existing:
+                error = 'У вас уже есть запись на это время'
+            
+            if error:
+                results[index] = {'index': index, 'success': False, 'error': error}
+                continue
+            
+            existing.add(key)
+            to_create.append((index, Booking(
+                user_id=item['user_id'],
+                user_name=user_names[item['user_id']],
+                master_id=item['master_id'],
+                master_name=item.get('master_name') or master_directory.get_name(
+                    item['master_id'], f'Мастер #{item["master_id"]}'
+                ),
+                date=item['date'],
+                time=item['time']
+            )))
+        
+        if mode == 'all_or_nothing' and len(to_create) != len(items):
+            for index, _ in to_create:
+                results[index] = {'index': index, 'success': False, 'error': 'Пакет отменен'}
+            return jsonify({'success': False, 'mode': mode, 'results': results}), 409
+        
+        # Сеансы попадут в историю через события booking.confirmed
+        db.session.add_all([booking for _, booking in to_create])
+        db.session.commit()
+        
+        for index, booking in to_create:
+            results[index] = {
+                'index': index,
+                'success': True,
+                'booking_id': booking.id,
+                'booking': serialize_booking(booking)
+            }
+        
+        return jsonify({
+            'success': bool(to_create),
+            'mode': mode,
+            'confirmed': len(to_create),
+            'results': results
+        })
+        
+    except requests.exceptions.ConnectionError:
+        return jsonify({'error': 'Нет соединения с сервисом пользователей'}), 500
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Внутренняя ошибка сервера: {str(e)}'}), 500
+
+def active_bookings_query(master_id=None, user_id=None):
+    query = Booking.query.with_entities(*booking_rows.columns(Booking))
+    if master_id is not None:
+        query = query.filter(Booking.master_id == master_id)
+    if user_id is not None:
+        query = query.filter(Booking.user_id == user_id)
+    return query
+
 @app.route('/active_bookings', methods=['GET', 'OPTIONS'])
 def get_active_bookings():
+    """Записи для панели администратора, от поздних к ранним: ?master_id, ?user_id,
+    ?from, ?to - фильтры, ?limit и ?cursor - страница, ?format=ndjson - потоковая выдача"""
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        bookings = Booking.query.order_by(Booking.date.desc(), Booking.time.desc()).all()
-        result = []
-        for b in bookings:
-            result.append({
-                'id': b.id,
-                'user_id': b.user_id,
-                'user': b.user_name,
-                'master_id': b.master_id,
-                'master': b.master_name,
-                'date': b.date,
-                'time': b.time,
-                'created_at': b.created_at.isoformat() if b.created_at else None
-            })
-        return jsonify({'success': True, 'active_bookings': result})
+        master_id = request.args.get('master_id', type=int)
+        user_id = request.args.get('user_id', type=int)
+        
+        # Размер всей выборки берется из счетчика; для фильтра по датам или
+        # по мастеру и пользователю одновременно счетчика нет - total_count = None
+        total_count = None
+        if not request.args.get('from') and not request.args.get('to'):
+            if master_id is None and user_id is None:
+                total_count = get_booking_count('all')
+            elif user_id is None:
+                total_count = get_booking_count(f'master:{master_id}')
+            elif master_id is None:
+                total_count = get_booking_count(f'user:{user_id}')
+        
+        return keyset_listing(
+            Booking, active_bookings_query(master_id, user_id), 'active_bookings', {'total_count': total_count},
+            booking_rows, descending=True
+        )
     except Exception as e:
         return jsonify({'error': f'Ошибка получения записей: {str(e)}'}), 500
 
+def user_bookings_query(user_id):
+    return Booking.query.with_entities(*booking_rows.columns(Booking)).filter(
+        Booking.user_id == user_id
+    ).order_by(
+        Booking.date.desc(), 
+        Booking.time.desc()
+    )
+
 @app.route('/user_bookings/<int:user_id>', methods=['GET', 'OPTIONS'])
 def get_user_bookings(user_id):
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        bookings = Booking.query.filter_by(user_id=user_id).order_by(
-            Booking.date.desc(), 
-            Booking.time.desc()
-        ).all()
-        
-        result = []
-        for b in bookings:
-            result.append({
-                'id': b.id,
-                'user_id': b.user_id,
-                'user': b.user_name,
-                'master_id': b.master_id,
-                'master': b.master_name,
-                'date': b.date,
-                'time': b.time,
-                'created_at': b.created_at.isoformat() if b.created_at else None
-            })
+        result = booking_rows.all(user_bookings_query(user_id))
         
-        return jsonify({
+        return json_response({
             'success': True,
             'user_id': user_id,
             'user_bookings': result,
@@ -219,9 +454,8 @@ def cancel_booking(booking_id):
         
         # Уведомляем Master Service об отмене
         try:
-            requests.delete(
-                f'http://localhost:5001/free_slot/{booking_data["master_id"]}/{booking_data["date"]}/{booking_data["time"]}',
-                timeout=5
+            master_client.delete(
+                f'/free_slot/{booking_data["master_id"]}/{booking_data["date"]}/{booking_data["time"]}'
             )
         except:
             print("⚠ Не удалось уведомить Master Service об отмене")
@@ -236,31 +470,25 @@ def cancel_booking(booking_id):
         db.session.rollback()
         return jsonify({'error': f'Ошибка отмены записи: {str(e)}'}), 500
 
+def master_bookings_query(master_id):
+    return Booking.query.with_entities(
+        *master_booking_rows.columns(Booking)
+    ).filter(
+        Booking.master_id == master_id
+    ).order_by(
+        Booking.date, 
+        Booking.time
+    )
+
 @app.route('/master_bookings/<int:master_id>', methods=['GET', 'OPTIONS'])
 def get_master_bookings(master_id):
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        bookings = Booking.query.filter_by(master_id=master_id).order_by(
-            Booking.date, 
-            Booking.time
-        ).all()
-        
-        result = []
-        for b in bookings:
-            result.append({
-                'id': b.id,
-                'user_id': b.user_id,
-                'user': b.user_name,
-                'client_id': b.user_id,  # Для совместимости с фронтендом
-                'master_id': b.master_id,
-                'master': b.master_name,
-                'date': b.date,
-                'time': b.time
-            })
+        result = master_booking_rows.all(master_bookings_query(master_id))
         
-        return jsonify({
+        return json_response({
             'success': True,
             'master_id': master_id,
             'master_bookings': result,
@@ -269,22 +497,31 @@ def get_master_bookings(master_id):
     except Exception as e:
         return jsonify({'error': f'Ошибка получения записей мастера: {str(e)}'}), 500
 
+@app.route('/invalidate_user/<int:user_id>', methods=['POST', 'OPTIONS'])
+def invalidate_user(user_id):
+    """Уведомление User Service об изменении или удалении пользователя"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    user_cache.invalidate(user_id)
+    return jsonify({'success': True, 'user_id': user_id})
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Счетчики кэша профилей пользователей и ответов по Idempotency-Key"""
+    return jsonify({'success': True, 'users': user_cache.stats(), 'idempotency': idempotency_store.stats()})
+
+@app.route('/event_stats', methods=['GET'])
+def event_stats():
+    """Очередь событий записей для History Service"""
+    return jsonify({'success': True, 'booking_events': booking_events.stats()})
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    try:
-        db.session.execute('SELECT 1')
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'timestamp': datetime.utcnow().isoformat()
-        })
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'database': 'disconnected',
-            'error': str(e),
-            'timestamp': datetime.utcnow().isoformat()
-        }), 500
+    health = health_monitor.snapshot()
+    database_ok = health['dependencies']['database'] == 'healthy'
+    health['database'] = 'connected' if database_ok else 'disconnected'
+    return jsonify(health), 200 if database_ok else 500
 
 if __name__ == '__main__':
     print("=" * 50)
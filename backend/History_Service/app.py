@@ -1,17 +1,27 @@
 from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import case, func, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_cors import CORS
 from datetime import datetime, timedelta
 import os
-import requests
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from service_client import get_client
+from sqlite_engine import create_sqlite_db
+from typed_columns import DayNumber, MinuteOfDay, migrate_typed_columns, day_number, minute_of_day, minute_to_hhmm
+from archive import Archiver
+from health_monitor import HealthMonitor, http_check
+from serialization import RowMapper, isoformat, json_response
+from availability_mask import TICK_MINUTES
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(os.path.dirname(__file__), 'history.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+db = create_sqlite_db(app, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'history.db'))
 
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+master_client = get_client('master')
+
 class SessionHistory(db.Model):
     __tablename__ = 'session_history'
     id = db.Column(db.Integer, primary_key=True)
@@ -19,74 +29,181 @@ class SessionHistory(db.Model):
     user_name = db.Column(db.String(100))
     master_id = db.Column(db.Integer, nullable=False)
     master_name = db.Column(db.String(100))
-    date = db.Column(db.String(20), nullable=False)
-    time = db.Column(db.String(10), nullable=False)
-    session_date = db.Column(db.String(20), nullable=False)
+    date = db.Column(DayNumber, nullable=False)
+    time = db.Column(MinuteOfDay, nullable=False)
+    session_date = db.Column(DayNumber, nullable=False)
     status = db.Column(db.String(20), default='pending')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # (user_id, session_date) - сеансы пользователя за период,
+    # (user_id, status, date) - последний завершенный сеанс и проверка дублей
+    __table_args__ = (
+        db.Index('ix_session_history_user_session_date', 'user_id', 'session_date', 'time'),
+        db.Index('ix_session_history_user_status_date', 'user_id', 'status', 'date'),
+    )
+
 class VisitHistory(db.Model):
     __tablename__ = 'visit_history'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, nullable=False)
     master_id = db.Column(db.Integer, nullable=False)
     master_name = db.Column(db.String(100))
-    date = db.Column(db.String(20), nullable=False)
-    time = db.Column(db.String(10), nullable=False)
+    date = db.Column(DayNumber, nullable=False)
+    time = db.Column(MinuteOfDay, nullable=False)
     day_of_week = db.Column(db.Integer)
     status = db.Column(db.String(20), default='completed')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Последнее завершенное посещение пользователя
+    __table_args__ = (
+        db.Index('ix_visit_history_user_status_date', 'user_id', 'status', 'date'),
+    )
+
+class UserVisitSummary(db.Model):
+    """Сводка завершенных посещений пользователя для рекомендаций: последний мастер
+    и время, число посещений, сумма минут начала (предпочитаемое время) и первая дата
+    (средний интервал). Обновляется в той же транзакции, что и запись VisitHistory"""
+    __tablename__ = 'user_visit_summary'
+    user_id = db.Column(db.Integer, primary_key=True)
+    last_master_id = db.Column(db.Integer, nullable=False)
+    last_master_name = db.Column(db.String(100))
+    last_date = db.Column(DayNumber, nullable=False)
+    last_time = db.Column(MinuteOfDay, nullable=False)
+    first_date = db.Column(DayNumber, nullable=False)
+    visit_count = db.Column(db.Integer, nullable=False, default=0)
+    minutes_total = db.Column(db.Integer, nullable=False, default=0)
+
+class EventIngestState(db.Model):
+    """Последнее примененное событие каждого потока (stream_id издателя)"""
+    __tablename__ = 'event_ingest_state'
+    stream = db.Column(db.String(36), primary_key=True)
+    last_seq = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# Записи старше горизонта переносятся в *_archive; незавершенные сеансы остаются в горячей таблице
+archiver = Archiver(app, db) \
+    .register(SessionHistory, where=SessionHistory.status != 'pending') \
+    .register(VisitHistory)
+
+# Строки списка сеансов: только нужные столбцы, без объектов ORM
+session_rows = RowMapper(
+    'id', 'user_id', 'user_name', 'master_id', 'master_name', 'date', 'time', 'session_date', 'status',
+    ('created_at', 'created_at', isoformat), ('updated_at', 'updated_at', isoformat)
+)
+
 def init_database():
     with app.app_context():
         try:
             db.create_all()
+            for model in (SessionHistory, VisitHistory):
+                migrate_typed_columns(db, model)
+                # create_all не добавляет индексы в уже существующие таблицы
+                for index in model.__table__.indexes:
+                    index.create(db.engine, checkfirst=True)
             print("✅ История сеансов: таблицы созданы")
         except Exception as e:
             print(f"❌ Ошибка при инициализации истории: {e}")
             db.session.rollback()
             raise e
 
+def record_completed_visit(user_id, master_id, master_name, date, time):
+    """Учитывает завершенное посещение в сводке пользователя (в текущей транзакции).
+    Посещение с более ранней датой, чем последнее, не меняет последнего мастера"""
+    table = UserVisitSummary.__table__
+    stmt = sqlite_insert(table).values(
+        user_id=user_id,
+        last_master_id=master_id,
+        last_master_name=master_name,
+        last_date=date,
+        last_time=time,
+        first_date=date,
+        visit_count=1,
+        minutes_total=minute_of_day(time)
+    )
+    is_latest = stmt.excluded.last_date >= table.c.last_date
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id],
+        set_={
+            'last_master_id': case((is_latest, stmt.excluded.last_master_id), else_=table.c.last_master_id),
+            'last_master_name': case((is_latest, stmt.excluded.last_master_name), else_=table.c.last_master_name),
+            'last_time': case((is_latest, stmt.excluded.last_time), else_=table.c.last_time),
+            'last_date': func.max(table.c.last_date, stmt.excluded.last_date),
+            'first_date': func.min(table.c.first_date, stmt.excluded.first_date),
+            'visit_count': table.c.visit_count + 1,
+            'minutes_total': table.c.minutes_total + stmt.excluded.minutes_total
+        }
+    ))
+
+def rebuild_visit_summaries():
+    """Заполняет сводки по истории (первый запуск после обновления): посещения,
+    а для пользователей без посещений - завершенные сеансы, как раньше делала рекомендация"""
+    summaries = {}
+    for model in (VisitHistory, SessionHistory):
+        source = archiver.source(model)
+        rows = db.session.query(
+            source.c.user_id, source.c.master_id, source.c.master_name, source.c.date, source.c.time
+        ).filter(source.c.status == 'completed').order_by(source.c.date, source.c.time, source.c.id)
+        users_with_visits = set(summaries)
+        for user_id, master_id, master_name, date, time in rows:
+            if user_id in users_with_visits:
+                continue
+            summary = summaries.get(user_id)
+            if summary is None:
+                summary = summaries[user_id] = UserVisitSummary(
+                    user_id=user_id, first_date=date, visit_count=0, minutes_total=0
+                )
+            summary.last_master_id = master_id
+            summary.last_master_name = master_name
+            summary.last_date = date
+            summary.last_time = time
+            summary.visit_count += 1
+            summary.minutes_total += minute_of_day(time)
+    db.session.add_all(summaries.values())
+    db.session.commit()
+    return len(summaries)
+
 with app.app_context():
     init_database()
+    if UserVisitSummary.query.first() is None:
+        rebuild_visit_summaries()
+
+def check_database():
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+
+# Фоновая проверка БД и Master Service, /health отвечает из памяти
+health_monitor = HealthMonitor({
+    'database': check_database,
+    'master_service': http_check(master_client)
+}).start()
+archiver.start()
 
 @app.route('/')
 def index():
     return jsonify({'service': 'History Service', 'status': 'running'})
 
+def visit_pattern(summary):
+    """Предпочитаемое время (среднее, по сетке расписания) и средний интервал между посещениями"""
+    preferred = round(summary.minutes_total / summary.visit_count / TICK_MINUTES) * TICK_MINUTES
+    cadence_days = None
+    if summary.visit_count > 1:
+        span = day_number(summary.last_date) - day_number(summary.first_date)
+        cadence_days = round(span / (summary.visit_count - 1), 1)
+    return {
+        'visit_count': summary.visit_count,
+        'preferred_time': minute_to_hhmm(preferred),
+        'cadence_days': cadence_days
+    }
+
 @app.route('/get_recommendation/<int:user_id>', methods=['GET'])
 def get_recommendation(user_id):
     try:
-        # Ищем последнее успешное посещение
-        last_visit = VisitHistory.query.filter_by(
-            user_id=user_id,
-            status='completed'
-        ).order_by(VisitHistory.date.desc()).first()
-        
-        if not last_visit:
-            # Если нет в VisitHistory, ищем в SessionHistory
-            last_session = SessionHistory.query.filter_by(
-                user_id=user_id,
-                status='completed'
-            ).order_by(SessionHistory.date.desc()).first()
-            
-            if not last_session:
-                return jsonify({'success': False, 'has_recommendation': False})
-            
-            # Создаем запись посещения на основе сеанса
-            visit_date = datetime.strptime(last_session.date, '%Y-%m-%d').date()
-            last_visit = VisitHistory(
-                user_id=user_id,
-                master_id=last_session.master_id,
-                master_name=last_session.master_name,
-                date=last_session.date,
-                time=last_session.time,
-                day_of_week=visit_date.weekday(),
-                status='completed'
-            )
-            db.session.add(last_visit)
-            db.session.commit()
+        # Последнее завершенное посещение - из сводки по первичному ключу, без записи в БД
+        summary = db.session.get(UserVisitSummary, user_id)
+        if not summary:
+            return jsonify({'success': False, 'has_recommendation': False})
         
         today = datetime.now().date()
         
@@ -95,41 +212,42 @@ def get_recommendation(user_id):
         
         # Проверяем доступность мастера на завтра
         try:
-            schedule_res = requests.get(
-                f'http://localhost:5001/schedule/{last_visit.master_id}/{tomorrow}',
-                timeout=5
+            schedule_res = master_client.get(
+                f'/schedule/{summary.last_master_id}/{tomorrow}'
             )
             
             if schedule_res.status_code == 200:
                 schedule_data = schedule_res.json()
                 available_times = schedule_data.get('available_times', [])
-                master_name = schedule_data.get('master_name', last_visit.master_name)
+                master_name = schedule_data.get('master_name', summary.last_master_name)
                 
                 # Проверяем то же самое время
-                if last_visit.time in available_times:
+                if summary.last_time in available_times:
                     return jsonify({
                         'success': True,
                         'has_recommendation': True,
                         'recommendation': {
-                            'master_id': last_visit.master_id,
+                            'master_id': summary.last_master_id,
                             'master_name': master_name,
                             'date': tomorrow.strftime('%Y-%m-%d'),
-                            'time': last_visit.time,
-                            'message': f'Хотите записаться на завтра ({tomorrow.strftime("%d.%m.%Y")}) в {last_visit.time} к {master_name}?'
+                            'time': summary.last_time,
+                            'pattern': visit_pattern(summary),
+                            'message': f'Хотите записаться на завтра ({tomorrow.strftime("%d.%m.%Y")}) в {summary.last_time} к {master_name}?'
                         }
                     })
                 else:
                     # Ищем ближайшее доступное время
                     for alt_time in available_times:
-                        if abs(int(alt_time[:2]) - int(last_visit.time[:2])) <= 2:
+                        if abs(int(alt_time[:2]) - int(summary.last_time[:2])) <= 2:
                             return jsonify({
                                 'success': True,
                                 'has_recommendation': True,
                                 'recommendation': {
-                                    'master_id': last_visit.master_id,
+                                    'master_id': summary.last_master_id,
                                     'master_name': master_name,
                                     'date': tomorrow.strftime('%Y-%m-%d'),
                                     'time': alt_time,
+                                    'pattern': visit_pattern(summary),
                                     'message': f'{master_name} свободен завтра в {alt_time}'
                                 }
                             })
@@ -178,6 +296,8 @@ def complete_visit():
         )
         
         db.session.add(visit)
+        if status == 'completed':
+            record_completed_visit(user_id, master_id, master_name, date, time)
         db.session.commit()
         
         # Обновляем статус в сессиях
@@ -246,6 +366,150 @@ def add_session():
         db.session.rollback()
         return jsonify({'error': f'Ошибка добавления сеанса: {str(e)}'}), 500
 
+@app.route('/add_sessions', methods=['POST', 'OPTIONS'])
+def add_sessions():
+    """Пакетное добавление сеансов одной транзакцией (уже существующие пропускаются)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        data = request.json or {}
+        sessions = data.get('sessions') or []
+        if not sessions:
+            return jsonify({'error': 'Нет данных'}), 400
+        
+        user_ids = {s['user_id'] for s in sessions}
+        dates = {s['date'] for s in sessions}
+        existing = {
+            (row.user_id, row.master_id, row.date, row.time)
+            for row in SessionHistory.query.with_entities(
+                SessionHistory.user_id, SessionHistory.master_id, SessionHistory.date, SessionHistory.time
+            ).filter(
+                SessionHistory.user_id.in_(user_ids),
+                SessionHistory.date.in_(dates)
+            ).all()
+        }
+        
+        added = []
+        for s in sessions:
+            key = (s['user_id'], s['master_id'], s['date'], s['time'])
+            if key in existing:
+                continue
+            existing.add(key)
+            added.append(SessionHistory(
+                user_id=s['user_id'],
+                user_name=s.get('user_name', f'Клиент #{s["user_id"]}'),
+                master_id=s['master_id'],
+                master_name=s.get('master_name', f'Мастер #{s["master_id"]}'),
+                date=s['date'],
+                time=s['time'],
+                session_date=s['date'],
+                status='pending'
+            ))
+        
+        db.session.add_all(added)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Сеансы добавлены в историю',
+            'added': len(added),
+            'skipped': len(sessions) - len(added)
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка добавления сеансов: {str(e)}'}), 500
+
+@app.route('/ingest_booking_events', methods=['POST', 'OPTIONS'])
+def ingest_booking_events():
+    """Пакет событий записей от Confirmation Service: booking.confirmed создает
+    ожидающий сеанс, booking.cancelled отменяет его. События применяются по порядку
+    одной транзакцией; seq не больше уже примененного пропускаются (повтор доставки)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        data = request.json or {}
+        stream = data.get('stream')
+        events = sorted(data.get('events') or [], key=lambda e: e['seq'])
+        if not stream:
+            return jsonify({'error': 'Не указан поток событий'}), 400
+        
+        state = db.session.get(EventIngestState, stream) or EventIngestState(stream=stream, last_seq=0)
+        events = [e for e in events if e['seq'] > state.last_seq]
+        if not events:
+            return jsonify({'success': True, 'applied': 0, 'last_seq': state.last_seq})
+        
+        # Ожидающие сеансы затронутых пользователей на затронутые даты - одним запросом
+        pending = {
+            (row.user_id, row.master_id, row.date, row.time): row.id
+            for row in SessionHistory.query.with_entities(
+                SessionHistory.id, SessionHistory.user_id, SessionHistory.master_id,
+                SessionHistory.date, SessionHistory.time
+            ).filter(
+                SessionHistory.user_id.in_({e['user_id'] for e in events}),
+                SessionHistory.date.in_({e['date'] for e in events}),
+                SessionHistory.status == 'pending'
+            ).all()
+        }
+        
+        added = []
+        cancelled_ids = []
+        cancelled = 0
+        for e in events:
+            key = (e['user_id'], e['master_id'], e['date'], e['time'])
+            if e['type'] == 'booking.confirmed':
+                if key in pending:
+                    continue
+                session = SessionHistory(
+                    user_id=e['user_id'],
+                    user_name=e.get('user_name') or f'Клиент #{e["user_id"]}',
+                    master_id=e['master_id'],
+                    master_name=e.get('master_name') or f'Мастер #{e["master_id"]}',
+                    date=e['date'],
+                    time=e['time'],
+                    session_date=e['date'],
+                    status='pending'
+                )
+                added.append(session)
+                pending[key] = session
+            elif e['type'] == 'booking.cancelled' and key in pending:
+                session = pending.pop(key)
+                cancelled += 1
+                if isinstance(session, SessionHistory):
+                    session.status = 'cancelled'
+                else:
+                    cancelled_ids.append(session)
+        
+        db.session.add_all(added)
+        if cancelled_ids:
+            SessionHistory.query.filter(SessionHistory.id.in_(cancelled_ids)).update(
+                {'status': 'cancelled', 'updated_at': datetime.utcnow()}, synchronize_session=False
+            )
+        state.last_seq = events[-1]['seq']
+        db.session.add(state)
+        db.session.commit()
+        
+        return jsonify({
+            'success': True,
+            'applied': len(events),
+            'added': len(added),
+            'cancelled': cancelled,
+            'last_seq': state.last_seq
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка приема событий: {str(e)}'}), 500
+
+def user_sessions_query(source, user_id, date_from):
+    """source - таблица сеансов или ее объединение с архивом (archiver.source)"""
+    return db.session.query(*session_rows.columns(source)).filter(
+        source.c.user_id == user_id,
+        source.c.session_date >= date_from
+    ).order_by(source.c.session_date.desc(), source.c.time.desc())
+
 @app.route('/user_sessions/<int:user_id>', methods=['GET', 'OPTIONS'])
 def get_user_sessions(user_id):
     if request.method == 'OPTIONS':
@@ -254,28 +518,11 @@ def get_user_sessions(user_id):
     try:
         week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
         
-        sessions = SessionHistory.query.filter(
-            SessionHistory.user_id == user_id,
-            SessionHistory.session_date >= week_ago
-        ).order_by(SessionHistory.session_date.desc(), SessionHistory.time.desc()).all()
-        
-        result = []
-        for s in sessions:
-            result.append({
-                'id': s.id,
-                'user_id': s.user_id,
-                'user_name': s.user_name,
-                'master_id': s.master_id,
-                'master_name': s.master_name,
-                'date': s.date,
-                'time': s.time,
-                'session_date': s.session_date,
-                'status': s.status,
-                'created_at': s.created_at.isoformat() if s.created_at else None,
-                'updated_at': s.updated_at.isoformat() if s.updated_at else None
-            })
+        # При горизонте архивации больше недели читается только горячая таблица
+        source = archiver.source(SessionHistory, week_ago)
+        result = session_rows.all(user_sessions_query(source, user_id, week_ago))
         
-        return jsonify({
+        return json_response({
             'success': True,
             'user_id': user_id,
             'sessions': result,
@@ -318,14 +565,14 @@ def update_session(session_id):
                 status='completed'
             )
             db.session.add(visit)
+            record_completed_visit(session.user_id, session.master_id, session.master_name, session.date, session.time)
             db.session.commit()
         
         # Если сеанс отменен - освобождаем слот у мастера
         if data['status'] == 'cancelled':
             try:
-                requests.delete(
-                    f'http://localhost:5001/free_slot/{session.master_id}/{session.date}/{session.time}',
-                    timeout=5
+                master_client.delete(
+                    f'/free_slot/{session.master_id}/{session.date}/{session.time}'
                 )
             except:
                 print("⚠ Не удалось освободить слот у мастера")
@@ -343,6 +590,18 @@ def update_session(session_id):
         db.session.rollback()
         return jsonify({'error': f'Ошибка обновления сеанса: {str(e)}'}), 500
 
+@app.route('/archive_stats', methods=['GET'])
+def archive_stats():
+    """Размер горячих и архивных таблиц истории"""
+    return jsonify({'success': True, 'archive': archiver.stats()})
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    health = health_monitor.snapshot()
+    database_ok = health['dependencies']['database'] == 'healthy'
+    health['database'] = 'connected' if database_ok else 'disconnected'
+    return jsonify(health), 200 if database_ok else 500
+
 if __name__ == '__main__':
     print("=" * 50)
     print("📚 Запуск History Service...")
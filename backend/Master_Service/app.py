@@ -1,17 +1,53 @@
 from flask import Flask, jsonify, request
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date as date_type
+from functools import lru_cache
 import os
+import sys
+import threading
 import requests
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlite_engine import create_sqlite_db
+from health_monitor import HealthMonitor
+from cache import LRUCache
+from archive import Archiver
+from pagination import keyset_listing
+from serialization import RowMapper
+from availability_mask import AvailabilityMask, TICK_MINUTES, SLOT_MINUTES
+from slot_search import SlotIndex, time_to_minutes, minutes_to_time
+from typed_columns import DayNumber, MinuteOfDay, day_number, minute_of_day, migrate_typed_columns
+
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(os.path.dirname(__file__), 'masters.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+db = create_sqlite_db(app, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'masters.db'))
 
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+# Максимальная длина диапазона для /schedule_range
+MAX_SCHEDULE_RANGE_DAYS = 31
+
+# Максимальная длина периода для /free_range и /block_range
+MAX_BULK_RANGE_DAYS = 92
+
+# Максимальное окно поиска ближайшего слота в /availability (минуты в обе стороны)
+MAX_AVAILABILITY_WINDOW = 12 * 60
+
+# График по умолчанию для мастеров без собственного шаблона: пн-пт 10:00-18:00
+DEFAULT_WORKING_HOURS = {weekday: ('10:00', '18:00', ()) for weekday in range(5)}
+
+# Размер LRU-кэша скомпилированных таблиц слотов
+SCHEDULE_CACHE_SIZE = 4096
+
+# Кэш доступности (master_id, date) -> AvailabilityMask, сбрасывается при каждой записи в booked_slots
+AVAILABILITY_CACHE_SIZE = int(os.environ.get('AVAILABILITY_CACHE_SIZE', 4096))
+availability_cache = LRUCache(maxsize=AVAILABILITY_CACHE_SIZE)
+
+# Имена мастеров меняются только в БД напрямую, поэтому достаточно TTL
+MASTER_CACHE_TTL = float(os.environ.get('MASTER_CACHE_TTL', 60))
+master_name_cache = LRUCache(maxsize=1024, ttl=MASTER_CACHE_TTL)
+
 class Master(db.Model):
     __tablename__ = 'masters'
     id = db.Column(db.Integer, primary_key=True)
@@ -20,25 +56,91 @@ class Master(db.Model):
 class BookedSlot(db.Model):
     __tablename__ = 'booked_slots'
     id = db.Column(db.Integer, primary_key=True)
-    master_id = db.Column(db.Integer, nullable=False, index=True)
-    date = db.Column(db.String(20), nullable=False)
-    time = db.Column(db.String(10), nullable=False)
+    master_id = db.Column(db.Integer, nullable=False)
+    date = db.Column(DayNumber, nullable=False)
+    time = db.Column(MinuteOfDay, nullable=False)
     client_id = db.Column(db.Integer, nullable=False)
 
+    # Уникальный индекс: базой арбитрируются конкурентные брони одного слота,
+    # префикс (master_id, date) используется для выборок по дням и диапазонам;
+    # (date, master_id) - для выборок по всем мастерам на дату
+    __table_args__ = (
+        db.Index('ux_booked_slots_master_date_time', 'master_id', 'date', 'time', unique=True),
+        db.Index('ix_booked_slots_date_master', 'date', 'master_id', 'time'),
+    )
+
 class MasterVisitHistory(db.Model):
     __tablename__ = 'master_visit_history'
     id = db.Column(db.Integer, primary_key=True)
     master_id = db.Column(db.Integer, nullable=False)
     client_id = db.Column(db.Integer, nullable=False)
     client_name = db.Column(db.String(100))
-    date = db.Column(db.String(20), nullable=False)
-    time = db.Column(db.String(10), nullable=False)
+    date = db.Column(DayNumber, nullable=False)
+    time = db.Column(MinuteOfDay, nullable=False)
     status = db.Column(db.String(20), default='completed')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Ключ постраничной выдачи истории мастера
+    __table_args__ = (
+        db.Index('ix_master_visit_history_master_date_time', 'master_id', 'date', 'time', 'id'),
+    )
+
+class WorkingHours(db.Model):
+    """Шаблон рабочего дня мастера (одна строка на день недели)"""
+    __tablename__ = 'working_hours'
+    id = db.Column(db.Integer, primary_key=True)
+    master_id = db.Column(db.Integer, nullable=False)
+    weekday = db.Column(db.Integer, nullable=False)
+    start_time = db.Column(db.String(5), nullable=False)
+    end_time = db.Column(db.String(5), nullable=False)
+    breaks = db.Column(db.String(200), default='')  # '13:00-14:00,16:00-16:30'
+
+    __table_args__ = (
+        db.UniqueConstraint('master_id', 'weekday', name='ux_working_hours_master_weekday'),
+    )
+
+class ScheduleException(db.Model):
+    """Исключение из шаблона на конкретную дату (выходной, праздник, особая смена)"""
+    __tablename__ = 'schedule_exceptions'
+    id = db.Column(db.Integer, primary_key=True)
+    master_id = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.String(20), nullable=False)
+    day_off = db.Column(db.Boolean, nullable=False, default=True)
+    start_time = db.Column(db.String(5))
+    end_time = db.Column(db.String(5))
+    breaks = db.Column(db.String(200), default='')
+    reason = db.Column(db.String(200))
+
+    __table_args__ = (
+        db.UniqueConstraint('master_id', 'date', name='ux_schedule_exceptions_master_date'),
+    )
+
+# Посещения старше горизонта переносятся в master_visit_history_archive
+archiver = Archiver(app, db).register(MasterVisitHistory)
+
+# Строки списков: только нужные столбцы, без объектов ORM
+booked_slot_rows = RowMapper('id', 'date', 'time', 'client_id')
+visit_rows = RowMapper('id', 'master_id', 'client_id', 'client_name', 'date', 'time', 'status')
+
 def init_database():
     with app.app_context():
         db.create_all()
+        # Перед созданием уникального индекса убираем дубли, оставшиеся от старой схемы
+        db.session.execute(text(
+            'DELETE FROM booked_slots WHERE id NOT IN '
+            '(SELECT MIN(id) FROM booked_slots GROUP BY master_id, date, time)'
+        ))
+        db.session.execute(text('DROP INDEX IF EXISTS ix_booked_slots_master_date'))
+        # Покрывается префиксом уникального индекса
+        db.session.execute(text('DROP INDEX IF EXISTS ix_booked_slots_master_id'))
+        db.session.commit()
+        # Строковые date/time старой схемы переводятся в INTEGER на месте
+        for model in (BookedSlot, MasterVisitHistory):
+            migrate_typed_columns(db, model)
+        # create_all не добавляет индексы в уже существующие таблицы
+        for model in (BookedSlot, MasterVisitHistory):
+            for index in model.__table__.indexes:
+                index.create(db.engine, checkfirst=True)
         
         if not Master.query.first():
             masters = [
@@ -52,6 +154,15 @@ def init_database():
 
 init_database()
 
+def check_database():
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+
+# Фоновая проверка БД, /health отвечает из памяти
+health_monitor = HealthMonitor({'database': check_database}).start()
+archiver.start()
+
 @app.route('/')
 def index():
     return jsonify({'service': 'Master Service', 'status': 'running'})
@@ -62,50 +173,572 @@ def get_masters():
         return '', 200
     
     masters = Master.query.all()
-    return jsonify({str(m.id): m.name for m in masters})
+    response = jsonify({str(m.id): m.name for m in masters})
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/masters/<int:master_id>', methods=['GET', 'OPTIONS'])
+def get_master(master_id):
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    master = Master.query.get(master_id)
+    if not master:
+        return jsonify({'error': 'Мастер не найден'}), 404
+    
+    response = jsonify({'id': master.id, 'name': master.name})
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/schedule/<int:master_id>/<date>', methods=['GET', 'OPTIONS'])
 def get_schedule(master_id, date):
     if request.method == 'OPTIONS':
         return '', 200
     
+    if not is_valid_slot(date):
+        return jsonify({'error': 'Неверный формат даты'}), 400
+    
+    master_name = get_master_name(master_id)
+    if master_name is None:
+        return jsonify({'error': 'Мастер не найден'}), 404
+    
+    try:
+        mask = get_availability_mask(master_id, date)
+        
+        if request.args.get('format') == 'bitmask':
+            return jsonify({
+                'master_id': master_id,
+                'date': date,
+                'tick_minutes': TICK_MINUTES,
+                'slot_ticks': mask.slot_ticks,
+                'mask': mask.to_compact()
+            })
+        
+        return jsonify(render_availability(mask, {
+            'master_id': master_id,
+            'master_name': master_name,
+            'date': date
+        }))
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения расписания: {str(e)}'}), 500
+
+def get_availability_mask(master_id, date):
+    """Битовая маска доступности мастера на день (из кэша или по строкам booked_slots)"""
+    return availability_cache.get_or_load((master_id, date), lambda: load_availability_mask(master_id, date))
+
+def booked_times_query(master_id, date):
+    return BookedSlot.query.with_entities(BookedSlot.time).filter_by(master_id=master_id, date=date)
+
+def load_availability_mask(master_id, date):
+    booked = booked_times_query(master_id, date).all()
+    return AvailabilityMask.from_schedule(generate_full_schedule(date, master_id), [t for (t,) in booked])
+
+def invalidate_availability(master_id, date):
+    """Вызывается после каждого коммита, меняющего booked_slots мастера на дату"""
+    # master_id из JSON может прийти строкой, а ключ кэша берется из URL как int
+    availability_cache.invalidate((int(master_id), date))
+
+def is_valid_slot(date, time=None):
+    """Дата (и время) в формате, который принимают типизированные столбцы"""
+    try:
+        day_number(date)
+        if time is not None:
+            minute_of_day(time)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+def get_master_name(master_id):
+    """Имя мастера или None, если мастер не найден"""
+    def load():
+        master = Master.query.get(master_id)
+        return master.name if master else None
+    return master_name_cache.get_or_load(master_id, load)
+
+def render_availability(mask, data=None):
+    """JSON-представление маски в прежнем формате списков времен"""
+    result = dict(data or {})
+    result.update({
+        'available_times': mask.available_times(),
+        'booked_times': mask.booked_times(),
+        'all_slots': mask.all_slots()
+    })
+    return result
+
+def generate_full_schedule(date, master_id=None):
+    """Начала сеансов мастера на дату (поиск в скомпилированных таблицах)"""
+    try:
+        weekday = date_type.fromisoformat(date).weekday()
+    except (TypeError, ValueError):
+        return ()
+    
+    if master_id is None:
+        return compile_slots(*DEFAULT_WORKING_HOURS[weekday]) if weekday in DEFAULT_WORKING_HOURS else ()
+    
+    version = schedule_versions.get(master_id, 0)
+    exceptions = compiled_exceptions(master_id, version)
+    if date in exceptions:
+        return exceptions[date]
+    return compiled_day(master_id, weekday, version)
+
+# Версии шаблонов по мастерам: входят в ключ кэша, увеличиваются при любом изменении
+schedule_versions = {}
+schedule_versions_lock = threading.Lock()
+
+def invalidate_schedule(master_id):
+    with schedule_versions_lock:
+        schedule_versions[master_id] = schedule_versions.get(master_id, 0) + 1
+    # Маски строятся по шаблону, поэтому сбрасываем все дни мастера
+    availability_cache.invalidate_where(lambda key: key[0] == master_id)
+
+def parse_breaks(value):
+    """'13:00-14:00,16:00-16:30' -> ((780, 840), (960, 990))"""
+    if not value:
+        return ()
+    return tuple(
+        (time_to_minutes(start), time_to_minutes(end))
+        for start, end in (item.split('-') for item in value.split(',') if item)
+    )
+
+@lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def compile_slots(start, end, breaks=''):
+    """Неизменяемая таблица начал сеансов для рабочего интервала с перерывами"""
+    start_minutes, end_minutes = time_to_minutes(start), time_to_minutes(end)
+    break_ranges = parse_breaks(breaks) if isinstance(breaks, str) else breaks
+    slots = []
+    current = start_minutes
+    while current + SLOT_MINUTES <= end_minutes:
+        overlap = next((b for b in break_ranges if current < b[1] and b[0] < current + SLOT_MINUTES), None)
+        if overlap:
+            current = overlap[1]
+            continue
+        slots.append(minutes_to_time(current))
+        current += SLOT_MINUTES
+    return tuple(slots)
+
+@lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def compiled_day(master_id, weekday, version):
+    """Таблица слотов мастера на день недели для версии шаблона"""
+    template = WorkingHours.query.filter_by(master_id=master_id).all()
+    if not template:
+        default = DEFAULT_WORKING_HOURS.get(weekday)
+        return compile_slots(*default) if default else ()
+    
+    for row in template:
+        if row.weekday == weekday:
+            return compile_slots(row.start_time, row.end_time, row.breaks or '')
+    return ()
+
+@lru_cache(maxsize=SCHEDULE_CACHE_SIZE)
+def compiled_exceptions(master_id, version):
+    """Таблицы слотов для дат-исключений мастера: {дата: слоты}"""
+    result = {}
+    for row in ScheduleException.query.filter_by(master_id=master_id).all():
+        if row.day_off or not row.start_time or not row.end_time:
+            result[row.date] = ()
+        else:
+            result[row.date] = compile_slots(row.start_time, row.end_time, row.breaks or '')
+    return result
+
+def serialize_breaks(breaks):
+    """[['13:00', '14:00'], ...] -> '13:00-14:00,...' с проверкой формата"""
+    items = []
+    for start, end in breaks or []:
+        if time_to_minutes(start) >= time_to_minutes(end):
+            raise ValueError(f'Неверный перерыв {start}-{end}')
+        items.append(f'{start}-{end}')
+    return ','.join(items)
+
+def validate_interval(start, end):
+    if not start or not end:
+        raise ValueError('Не указано время начала или окончания')
+    datetime.strptime(start, '%H:%M')
+    datetime.strptime(end, '%H:%M')
+    if time_to_minutes(start) >= time_to_minutes(end):
+        raise ValueError(f'Неверный интервал {start}-{end}')
+
+def render_breaks(value):
+    return [[start, end] for start, end in (item.split('-') for item in (value or '').split(',') if item)]
+
+@app.route('/working_hours/<int:master_id>', methods=['GET', 'PUT', 'OPTIONS'])
+def working_hours(master_id):
+    """Шаблон рабочих часов мастера и исключения по датам"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    master = Master.query.get(master_id)
+    if not master:
+        return jsonify({'error': 'Мастер не найден'}), 404
+    
+    if request.method == 'PUT':
+        data = request.json or {}
+        days = data.get('days')
+        if days is None:
+            return jsonify({'error': 'Не указаны рабочие дни'}), 400
+        
+        try:
+            rows = {}
+            for day in days:
+                weekday = int(day.get('weekday'))
+                if weekday not in range(7):
+                    raise ValueError(f'Неверный день недели {weekday}')
+                validate_interval(day.get('start'), day.get('end'))
+                rows[weekday] = WorkingHours(
+                    master_id=master_id,
+                    weekday=weekday,
+                    start_time=day['start'],
+                    end_time=day['end'],
+                    breaks=serialize_breaks(day.get('breaks'))
+                )
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': f'Неверный шаблон: {str(e)}'}), 400
+        
+        try:
+            WorkingHours.query.filter_by(master_id=master_id).delete()
+            db.session.add_all(rows.values())
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Ошибка сохранения шаблона: {str(e)}'}), 500
+        
+        invalidate_schedule(master_id)
+    
+    template = WorkingHours.query.filter_by(master_id=master_id).order_by(WorkingHours.weekday).all()
+    exceptions = ScheduleException.query.filter_by(master_id=master_id).order_by(ScheduleException.date).all()
+    
+    return jsonify({
+        'success': True,
+        'master_id': master_id,
+        'is_default': not template,
+        'days': [{
+            'weekday': row.weekday,
+            'start': row.start_time,
+            'end': row.end_time,
+            'breaks': render_breaks(row.breaks)
+        } for row in template] if template else [{
+            'weekday': weekday, 'start': start, 'end': end, 'breaks': []
+        } for weekday, (start, end, _) in sorted(DEFAULT_WORKING_HOURS.items())],
+        'exceptions': [{
+            'date': row.date,
+            'day_off': row.day_off,
+            'start': row.start_time,
+            'end': row.end_time,
+            'breaks': render_breaks(row.breaks),
+            'reason': row.reason
+        } for row in exceptions],
+        'version': schedule_versions.get(master_id, 0)
+    })
+
+@app.route('/schedule_exceptions/<int:master_id>', methods=['POST', 'OPTIONS'])
+def add_schedule_exception(master_id):
+    """Добавление или замена исключения на дату (праздник, выходной, особая смена)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    if not Master.query.get(master_id):
+        return jsonify({'error': 'Мастер не найден'}), 404
+    
+    data = request.json or {}
+    date = data.get('date')
+    day_off = bool(data.get('day_off', not data.get('start')))
+    
+    try:
+        date_type.fromisoformat(date)
+        if not day_off:
+            validate_interval(data.get('start'), data.get('end'))
+        breaks = serialize_breaks(data.get('breaks'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Неверное исключение: {str(e)}'}), 400
+    
+    try:
+        exception = ScheduleException.query.filter_by(master_id=master_id, date=date).first()
+        if not exception:
+            exception = ScheduleException(master_id=master_id, date=date)
+            db.session.add(exception)
+        exception.day_off = day_off
+        exception.start_time = None if day_off else data['start']
+        exception.end_time = None if day_off else data['end']
+        exception.breaks = '' if day_off else breaks
+        exception.reason = data.get('reason')
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка сохранения исключения: {str(e)}'}), 500
+    
+    invalidate_schedule(master_id)
+    
+    return jsonify({
+        'success': True,
+        'message': 'Исключение сохранено',
+        'master_id': master_id,
+        'date': date,
+        'all_slots': list(generate_full_schedule(date, master_id))
+    })
+
+@app.route('/schedule_exceptions/<int:master_id>/<date>', methods=['DELETE', 'OPTIONS'])
+def delete_schedule_exception(master_id, date):
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        deleted = ScheduleException.query.filter_by(master_id=master_id, date=date).delete()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка удаления исключения: {str(e)}'}), 500
+    
+    if not deleted:
+        return jsonify({'error': 'Исключение не найдено'}), 404
+    
+    invalidate_schedule(master_id)
+    return jsonify({'success': True, 'message': 'Исключение удалено'})
+
+def booked_range_query(master_id, date_from, date_to):
+    """Занятые слоты мастера на диапазон: один запрос по индексу (master_id, date)"""
+    return BookedSlot.query.with_entities(BookedSlot.date, BookedSlot.time).filter(
+        BookedSlot.master_id == master_id,
+        BookedSlot.date >= date_from,
+        BookedSlot.date <= date_to
+    )
+
+@app.route('/schedule_range/<int:master_id>', methods=['GET', 'OPTIONS'])
+def get_schedule_range(master_id):
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    
+    if not date_from or not date_to:
+        return jsonify({'error': 'Не указаны параметры from и to'}), 400
+    
+    try:
+        start = datetime.strptime(date_from, '%Y-%m-%d')
+        end = datetime.strptime(date_to, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'error': 'Неверный формат даты'}), 400
+    
+    if end < start:
+        return jsonify({'error': 'Дата to раньше даты from'}), 400
+    
+    if (end - start).days >= MAX_SCHEDULE_RANGE_DAYS:
+        return jsonify({'error': f'Диапазон не может превышать {MAX_SCHEDULE_RANGE_DAYS} дней'}), 400
+    
     master = Master.query.get(master_id)
     if not master:
         return jsonify({'error': 'Мастер не найден'}), 404
     
     try:
-        all_slots = generate_full_schedule(date)
-        booked = BookedSlot.query.filter_by(master_id=master_id, date=date).all()
-        booked_times = [b.time for b in booked]
-        available = [t for t in all_slots if t not in booked_times]
+        booked = booked_range_query(master_id, date_from, date_to).all()
         
-        return jsonify({
+        booked_by_date = {}
+        for slot_date, slot_time in booked:
+            booked_by_date.setdefault(slot_date, set()).add(slot_time)
+        
+        compact = request.args.get('format') == 'bitmask'
+        days = {}
+        current = start
+        while current <= end:
+            date_str = current.strftime('%Y-%m-%d')
+            mask = AvailabilityMask.from_schedule(
+                generate_full_schedule(date_str, master_id),
+                booked_by_date.get(date_str, ())
+            )
+            days[date_str] = mask.to_compact() if compact else render_availability(mask)
+            current += timedelta(days=1)
+        
+        result = {
             'master_id': master_id,
             'master_name': master.name,
-            'date': date,
-            'available_times': available,
-            'booked_times': booked_times,
-            'all_slots': all_slots
-        })
+            'from': date_from,
+            'to': date_to,
+            'days': days
+        }
+        if compact:
+            result['tick_minutes'] = TICK_MINUTES
+            result['slot_ticks'] = AvailabilityMask().slot_ticks
+        return jsonify(result)
     except Exception as e:
         return jsonify({'error': f'Ошибка получения расписания: {str(e)}'}), 500
 
-def generate_full_schedule(date):
+def booked_in_range_query(date_from, date_to):
+    """Занятые слоты всех мастеров на диапазон: один запрос по индексу (date, master_id)"""
+    return BookedSlot.query.with_entities(BookedSlot.master_id, BookedSlot.date, BookedSlot.time).filter(
+        BookedSlot.date >= date_from,
+        BookedSlot.date <= date_to
+    )
+
+@app.route('/availability_range', methods=['GET', 'OPTIONS'])
+def get_availability_range():
+    """Доступность всех мастеров на диапазон дат (?from&to[&exclude=id][&format=bitmask])
+    одним запросом к booked_slots - вместо /schedule_range для каждого мастера"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    
+    try:
+        start = date_type.fromisoformat(date_from)
+        end = date_type.fromisoformat(date_to)
+        exclude = request.args.get('exclude', type=int)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Неверный формат даты'}), 400
+    
+    if end < start:
+        return jsonify({'error': 'Дата to раньше даты from'}), 400
+    
+    if (end - start).days >= MAX_SCHEDULE_RANGE_DAYS:
+        return jsonify({'error': f'Диапазон не может превышать {MAX_SCHEDULE_RANGE_DAYS} дней'}), 400
+    
     try:
-        dt = datetime.strptime(date, '%Y-%m-%d')
-        weekday = dt.weekday()
+        masters_query = Master.query.with_entities(Master.id, Master.name)
+        if exclude is not None:
+            masters_query = masters_query.filter(Master.id != exclude)
+        masters = masters_query.all()
+        
+        booked = {}
+        for slot_master_id, slot_date, slot_time in booked_in_range_query(date_from, date_to).all():
+            booked.setdefault((slot_master_id, slot_date), []).append(slot_time)
         
-        if weekday >= 5:
-            return []
+        dates = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+        compact = request.args.get('format') == 'bitmask'
+        result_masters = {}
+        for master_id, master_name in masters:
+            days = {}
+            for date_str in dates:
+                mask = AvailabilityMask.from_schedule(
+                    generate_full_schedule(date_str, master_id),
+                    booked.get((master_id, date_str), ())
+                )
+                days[date_str] = mask.to_compact() if compact else render_availability(mask)
+            result_masters[master_id] = {'master_name': master_name, 'days': days}
         
-        start = datetime.strptime(f'{date} 10:00', '%Y-%m-%d %H:%M')
-        slots = []
-        for i in range(8):
-            slots.append(start.strftime('%H:%M'))
-            start += timedelta(hours=1)
-        return slots
-    except:
-        return []
+        result = {
+            'from': date_from,
+            'to': date_to,
+            'masters': result_masters
+        }
+        if compact:
+            result['tick_minutes'] = TICK_MINUTES
+            result['slot_ticks'] = AvailabilityMask().slot_ticks
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения доступности: {str(e)}'}), 500
+
+def booked_for_masters_query(master_ids, date):
+    return BookedSlot.query.with_entities(BookedSlot.master_id, BookedSlot.time).filter(
+        BookedSlot.master_id.in_(master_ids),
+        BookedSlot.date == date
+    )
+
+@app.route('/schedule_common/<date>', methods=['GET', 'OPTIONS'])
+def get_common_schedule(date):
+    """Время, когда свободны все указанные мастера (?masters=1,2)"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        master_ids = [int(m) for m in request.args.get('masters', '').split(',') if m]
+    except ValueError:
+        return jsonify({'error': 'Неверный список мастеров'}), 400
+    
+    if not master_ids:
+        return jsonify({'error': 'Не указаны мастера'}), 400
+    
+    try:
+        found = Master.query.filter(Master.id.in_(master_ids)).count()
+        if found != len(set(master_ids)):
+            return jsonify({'error': 'Мастер не найден'}), 404
+        
+        booked_by_master = {}
+        for slot_master_id, slot_time in booked_for_masters_query(master_ids, date).all():
+            booked_by_master.setdefault(slot_master_id, []).append(slot_time)
+        
+        common = None
+        for master_id in master_ids:
+            mask = AvailabilityMask.from_schedule(
+                generate_full_schedule(date, master_id),
+                booked_by_master.get(master_id, [])
+            )
+            common = mask if common is None else common & mask
+        
+        after = request.args.get('after')
+        result = render_availability(common, {'masters': master_ids, 'date': date})
+        if after:
+            result['first_free'] = common.first_free_at_or_after(after)
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': f'Ошибка получения расписания: {str(e)}'}), 500
+
+def booked_on_date_query(date):
+    """Занятые слоты всех мастеров на дату: один запрос по индексу (date, master_id)
+    вместо расписания каждого мастера"""
+    return BookedSlot.query.with_entities(BookedSlot.master_id, BookedSlot.time).filter(BookedSlot.date == date)
+
+@app.route('/availability', methods=['GET', 'OPTIONS'])
+def get_availability():
+    """Свободные мастера на дату и время (?date&time[&window=минуты]),
+    ранжированные по близости ближайшего свободного слота"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    date = request.args.get('date')
+    time = request.args.get('time')
+    
+    try:
+        date_type.fromisoformat(date)
+        datetime.strptime(time, '%H:%M')
+        window = request.args.get('window', 0, type=int)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Неверный формат даты или времени'}), 400
+    
+    if not 0 <= window <= MAX_AVAILABILITY_WINDOW:
+        return jsonify({'error': f'Окно должно быть от 0 до {MAX_AVAILABILITY_WINDOW} минут'}), 400
+    
+    try:
+        masters = Master.query.with_entities(Master.id, Master.name).all()
+        
+        booked_by_master = {}
+        for slot_master_id, slot_time in booked_on_date_query(date).all():
+            booked_by_master.setdefault(slot_master_id, []).append(slot_time)
+        
+        target = time_to_minutes(time)
+        free_masters = []
+        for master_id, master_name in masters:
+            mask = AvailabilityMask.from_schedule(
+                generate_full_schedule(date, master_id),
+                booked_by_master.get(master_id, ())
+            )
+            # is_free округляет время до тика маски - точное совпадение только с началом сеанса
+            if time in mask.available_times():
+                nearest = target
+            else:
+                index = SlotIndex({date: mask.available_times()})
+                nearest = next(iter(index.nearest(date, target, 1)), None)
+                if nearest is None or abs(nearest - target) > window:
+                    continue
+            free_masters.append({
+                'master_id': master_id,
+                'master_name': master_name,
+                'time': minutes_to_time(nearest),
+                'difference': nearest - target,
+                'exact': nearest == target
+            })
+        
+        # Ближе по времени - выше; при равном расстоянии позднее время, как в поиске альтернатив
+        free_masters.sort(key=lambda m: (abs(m['difference']), m['difference'] < 0, m['master_id']))
+        
+        return jsonify({
+            'success': True,
+            'date': date,
+            'time': time,
+            'window': window,
+            'masters': free_masters,
+            'total_masters': len(masters)
+        })
+    except Exception as e:
+        return jsonify({'error': f'Ошибка поиска свободных мастеров: {str(e)}'}), 500
 
 @app.route('/book_slot/<int:master_id>/<date>/<time>', methods=['POST', 'OPTIONS'])
 def book_slot(master_id, date, time):
@@ -118,46 +751,139 @@ def book_slot(master_id, date, time):
     if not client_id:
         return jsonify({'error': 'Не указан client_id'}), 400
     
+    if not is_valid_slot(date, time):
+        return jsonify({'error': 'Неверный формат даты или времени'}), 400
+    
     master = Master.query.get(master_id)
     if not master:
         return jsonify({'error': 'Мастер не найден'}), 404
     
-    existing = BookedSlot.query.filter_by(master_id=master_id, date=date, time=time).first()
-    if existing:
-        return jsonify({'success': False, 'error': 'Слот уже забронирован'})
+    if time not in generate_full_schedule(date, master_id):
+        return jsonify({'error': 'Время вне расписания мастера'}), 400
     
-    slot = BookedSlot(master_id=master_id, date=date, time=time, client_id=client_id)
-    db.session.add(slot)
-    db.session.commit()
+    try:
+        booking_id = insert_booked_slot(master_id, date, time, client_id)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка бронирования слота: {str(e)}'}), 500
+    
+    if booking_id is None:
+        return jsonify({'success': False, 'conflict': True, 'error': 'Слот уже забронирован'}), 409
+    
+    invalidate_availability(master_id, date)
     
     return jsonify({
         'success': True,
         'message': 'Слот успешно забронирован',
-        'booking_id': slot.id
+        'booking_id': booking_id
     })
 
-@app.route('/master_bookings_api/<int:master_id>', methods=['GET', 'OPTIONS'])
-def get_master_bookings_api(master_id):
+def insert_booked_slot(master_id, date, time, client_id):
+    """Вставка слота одним запросом; None, если слот уже занят (конфликт по уникальному индексу)"""
+    result = db.session.execute(
+        sqlite_insert(BookedSlot.__table__)
+        .values(master_id=master_id, date=date, time=time, client_id=client_id)
+        .on_conflict_do_nothing(index_elements=['master_id', 'date', 'time'])
+    )
+    return result.lastrowid if result.rowcount == 1 else None
+
+@app.route('/book_slots', methods=['POST', 'OPTIONS'])
+def book_slots():
+    """Пакетное бронирование слотов (группами по мастеру и дате)"""
     if request.method == 'OPTIONS':
         return '', 200
     
+    data = request.json or {}
+    slots = data.get('slots') or []
+    mode = data.get('mode', 'all_or_nothing')
+    
+    if not slots:
+        return jsonify({'error': 'Не указаны слоты'}), 400
+    
+    if mode not in ('all_or_nothing', 'best_effort'):
+        return jsonify({'error': 'Неизвестный режим'}), 400
+    
     try:
-        bookings = BookedSlot.query.filter_by(master_id=master_id).all()
-        result = []
-        for b in bookings:
-            result.append({
-                'id': b.id,
-                'date': b.date,
-                'time': b.time,
-                'client_id': b.client_id
-            })
+        master_ids = {s.get('master_id') for s in slots}
+        existing_masters = {m.id for m in Master.query.filter(Master.id.in_(master_ids)).all()}
+        
+        # Группируем слоты по (мастер, дата), чтобы строить расписание один раз на группу
+        groups = {}
+        for index, slot in enumerate(slots):
+            groups.setdefault((slot.get('master_id'), slot.get('date')), []).append(index)
+        
+        results = [None] * len(slots)
+        to_book = []
+        for (master_id, date), indexes in groups.items():
+            working_slots = set(generate_full_schedule(date, master_id))
+            
+            for index in indexes:
+                slot = slots[index]
+                time = slot.get('time')
+                error = None
+                if not slot.get('client_id') or not time:
+                    error = 'Не все параметры указаны'
+                elif master_id not in existing_masters:
+                    error = 'Мастер не найден'
+                elif time not in working_slots:
+                    error = 'Время вне расписания мастера'
+                
+                if error:
+                    results[index] = {'index': index, 'success': False, 'error': error}
+                else:
+                    to_book.append(index)
+        
+        # Занятость проверяет сама база: конфликт по уникальному индексу - слот уже занят
+        booked = []
+        if mode == 'best_effort' or len(to_book) == len(slots):
+            for index in to_book:
+                slot = slots[index]
+                booking_id = insert_booked_slot(slot['master_id'], slot['date'], slot['time'], slot['client_id'])
+                if booking_id is None:
+                    results[index] = {'index': index, 'success': False, 'conflict': True, 'error': 'Слот уже забронирован'}
+                    if mode == 'all_or_nothing':
+                        break
+                else:
+                    booked.append((index, booking_id))
+        
+        if mode == 'all_or_nothing' and len(booked) != len(slots):
+            db.session.rollback()
+            for index in to_book:
+                if results[index] is None or results[index].get('success'):
+                    results[index] = {'index': index, 'success': False, 'error': 'Пакет отменен'}
+            return jsonify({'success': False, 'mode': mode, 'results': results}), 409
+        
+        db.session.commit()
+        
+        for index, booking_id in booked:
+            results[index] = {'index': index, 'success': True, 'booking_id': booking_id}
+            invalidate_availability(slots[index]['master_id'], slots[index]['date'])
         
         return jsonify({
-            'success': True,
-            'master_id': master_id,
-            'bookings': result,
-            'total': len(result)
+            'success': bool(booked),
+            'mode': mode,
+            'booked': len(booked),
+            'results': results
         })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка пакетного бронирования: {str(e)}'}), 500
+
+def master_bookings_query(master_id):
+    return BookedSlot.query.with_entities(*booked_slot_rows.columns(BookedSlot)).filter(
+        BookedSlot.master_id == master_id
+    )
+
+@app.route('/master_bookings_api/<int:master_id>', methods=['GET', 'OPTIONS'])
+def get_master_bookings_api(master_id):
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        return keyset_listing(
+            BookedSlot, master_bookings_query(master_id), 'bookings', {'master_id': master_id}, booked_slot_rows
+        )
     except Exception as e:
         return jsonify({'error': f'Ошибка получения записей мастера: {str(e)}'}), 500
 
@@ -202,6 +928,7 @@ def add_master_visit():
                 db.session.delete(slot)
         
         db.session.commit()
+        invalidate_availability(master_id, date)
         
         return jsonify({
             'success': True,
@@ -213,34 +940,23 @@ def add_master_visit():
         db.session.rollback()
         return jsonify({'error': f'Ошибка сохранения: {str(e)}'}), 500
 
+def master_visits_query(source, master_id):
+    """source - таблица истории или ее объединение с архивом (archiver.source)"""
+    return db.session.query(*visit_rows.columns(source)).filter(source.c.master_id == master_id)
+
 @app.route('/master_visit_history/<int:master_id>', methods=['GET', 'OPTIONS'])
 def get_master_visit_history(master_id):
     if request.method == 'OPTIONS':
         return '', 200
     
     try:
-        visits = MasterVisitHistory.query.filter_by(master_id=master_id)\
-            .order_by(MasterVisitHistory.date.desc(), MasterVisitHistory.time.desc())\
-            .all()
-        
-        result = []
-        for visit in visits:
-            result.append({
-                'id': visit.id,
-                'master_id': visit.master_id,
-                'client_id': visit.client_id,
-                'client_name': visit.client_name,
-                'date': visit.date,
-                'time': visit.time,
-                'status': visit.status
-            })
-        
-        return jsonify({
-            'success': True,
-            'master_id': master_id,
-            'visits': result,
-            'total': len(result)
-        })
+        # Архив читается, только если период начинается раньше горизонта архивации
+        source = archiver.source(MasterVisitHistory, request.args.get('from'))
+        # Сначала последние посещения
+        return keyset_listing(
+            source.c, master_visits_query(source, master_id), 'visits', {'master_id': master_id}, visit_rows,
+            descending=True
+        )
         
     except Exception as e:
         return jsonify({'error': f'Ошибка получения истории: {str(e)}'}), 500
@@ -250,12 +966,16 @@ def free_slot(master_id, date, time):
     if request.method == 'OPTIONS':
         return '', 200
     
+    if not is_valid_slot(date, time):
+        return jsonify({'error': 'Неверный формат даты или времени'}), 400
+    
     try:
         slot = BookedSlot.query.filter_by(master_id=master_id, date=date, time=time).first()
         
         if slot:
             db.session.delete(slot)
             db.session.commit()
+            invalidate_availability(master_id, date)
             return jsonify({
                 'success': True, 
                 'message': 'Слот освобожден'
@@ -267,6 +987,191 @@ def free_slot(master_id, date, time):
         db.session.rollback()
         return jsonify({'error': f'Ошибка освобождения слота: {str(e)}'}), 500
 
+@app.route('/free_slots', methods=['POST', 'OPTIONS'])
+def free_slots():
+    """Пакетное освобождение слотов одной транзакцией"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    data = request.json or {}
+    slots = data.get('slots') or []
+    
+    if not slots:
+        return jsonify({'error': 'Не указаны слоты'}), 400
+    
+    # Проверяем все слоты до удаления: после коммита ошибка уже не откатит освобождение
+    keys = []
+    for index, slot in enumerate(slots):
+        try:
+            master_id = int(slot.get('master_id'))
+        except (AttributeError, TypeError, ValueError):
+            return jsonify({'error': f'Неверный мастер (слот {index})'}), 400
+        if not slot.get('time') or not is_valid_slot(slot.get('date'), slot.get('time')):
+            return jsonify({'error': f'Неверный формат даты или времени (слот {index})'}), 400
+        keys.append((master_id, slot['date'], slot['time']))
+    
+    try:
+        freed = 0
+        for master_id, date, time in keys:
+            freed += BookedSlot.query.filter_by(
+                master_id=master_id,
+                date=date,
+                time=time
+            ).delete(synchronize_session=False)
+        db.session.commit()
+        
+        for master_id, date, _ in keys:
+            invalidate_availability(master_id, date)
+        
+        return jsonify({
+            'success': True,
+            'message': 'Слоты освобождены',
+            'freed': freed
+        })
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка освобождения слотов: {str(e)}'}), 500
+
+def parse_bulk_range(data):
+    """Проверенный период {from, to} -> (date_from, date_to, список дат)"""
+    date_from, date_to = data.get('from'), data.get('to')
+    start = date_type.fromisoformat(date_from)
+    end = date_type.fromisoformat(date_to)
+    if end < start:
+        raise ValueError('Дата to раньше даты from')
+    if (end - start).days >= MAX_BULK_RANGE_DAYS:
+        raise ValueError(f'Период не может превышать {MAX_BULK_RANGE_DAYS} дней')
+    dates = [(start + timedelta(days=offset)).isoformat() for offset in range((end - start).days + 1)]
+    return date_from, date_to, dates
+
+def delete_bookings_in_range(master_id, date_from, date_to):
+    """Удаляет брони мастера за период одним запросом и возвращает удаленные строки"""
+    table = BookedSlot.__table__
+    rows = db.session.execute(
+        table.delete()
+        .where(table.c.master_id == master_id, table.c.date >= date_from, table.c.date <= date_to)
+        .returning(table.c.id, table.c.date, table.c.time, table.c.client_id)
+    ).all()
+    return sorted(
+        ({'id': row.id, 'master_id': master_id, 'date': row.date, 'time': row.time, 'client_id': row.client_id}
+         for row in rows),
+        key=lambda booking: (booking['date'], booking['time'])
+    )
+
+@app.route('/free_range/<int:master_id>', methods=['POST', 'OPTIONS'])
+def free_range(master_id):
+    """Освобождение всех слотов мастера за период {from, to} одной транзакцией"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        date_from, date_to, _ = parse_bulk_range(request.json or {})
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Неверный период: {str(e)}'}), 400
+    
+    if get_master_name(master_id) is None:
+        return jsonify({'error': 'Мастер не найден'}), 404
+    
+    try:
+        bookings = delete_bookings_in_range(master_id, date_from, date_to)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка освобождения слотов: {str(e)}'}), 500
+    
+    for day in {booking['date'] for booking in bookings}:
+        invalidate_availability(master_id, day)
+    
+    return jsonify({
+        'success': True,
+        'message': 'Слоты за период освобождены',
+        'master_id': master_id,
+        'from': date_from,
+        'to': date_to,
+        'freed': len(bookings),
+        'bookings': bookings
+    })
+
+@app.route('/block_range/<int:master_id>', methods=['POST', 'OPTIONS'])
+def block_range(master_id):
+    """Закрытие дней мастера за период {from, to, reason}: выходные-исключения
+    на каждую дату и освобождение всех броней - одной транзакцией"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    data = request.json or {}
+    try:
+        date_from, date_to, dates = parse_bulk_range(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Неверный период: {str(e)}'}), 400
+    
+    if get_master_name(master_id) is None:
+        return jsonify({'error': 'Мастер не найден'}), 404
+    
+    reason = data.get('reason')
+    try:
+        # Исключения пишутся первыми: транзакция сразу берет блокировку записи
+        statement = sqlite_insert(ScheduleException.__table__).values([{
+            'master_id': master_id,
+            'date': day,
+            'day_off': True,
+            'start_time': None,
+            'end_time': None,
+            'breaks': '',
+            'reason': reason
+        } for day in dates])
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['master_id', 'date'],
+            set_={
+                'day_off': True,
+                'start_time': None,
+                'end_time': None,
+                'breaks': '',
+                'reason': statement.excluded.reason
+            }
+        ))
+        bookings = delete_bookings_in_range(master_id, date_from, date_to)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Ошибка закрытия периода: {str(e)}'}), 500
+    
+    # Новые исключения меняют расписание: сбрасываются все дни мастера
+    invalidate_schedule(master_id)
+    
+    return jsonify({
+        'success': True,
+        'message': 'Период закрыт',
+        'master_id': master_id,
+        'from': date_from,
+        'to': date_to,
+        'blocked_dates': dates,
+        'freed': len(bookings),
+        'bookings': bookings
+    })
+
+@app.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """Счетчики кэшей расписания"""
+    return jsonify({
+        'availability': availability_cache.stats(),
+        'master_names': master_name_cache.stats(),
+        'compiled_days': compiled_day.cache_info()._asdict(),
+        'compiled_exceptions': compiled_exceptions.cache_info()._asdict()
+    })
+
+@app.route('/archive_stats', methods=['GET'])
+def archive_stats():
+    """Размер горячих и архивных таблиц истории"""
+    return jsonify({'success': True, 'archive': archiver.stats()})
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    health = health_monitor.snapshot()
+    database_ok = health['dependencies']['database'] == 'healthy'
+    health['database'] = 'connected' if database_ok else 'disconnected'
+    return jsonify(health), 200 if database_ok else 500
+
 if __name__ == '__main__':
     print("=" * 50)
     print("🚀 Запуск Master Service...")
@@ -1,19 +1,25 @@
 from flask import Flask, request, jsonify
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import os
+import sys
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from sqlite_engine import create_sqlite_db
+from health_monitor import HealthMonitor
+from service_client import get_client
+from serialization import RowMapper, isoformat, json_response
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(os.path.dirname(__file__), 'users.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 # Настраиваем CORS
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# Создаем экземпляр SQLAlchemy
-db = SQLAlchemy(app)
+# Создаем экземпляр SQLAlchemy с общими настройками SQLite
+db = create_sqlite_db(app, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'users.db'))
 
 # Определяем модель User
 class User(db.Model):
@@ -34,6 +40,9 @@ class User(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None
         }
 
+# Строки списка пользователей: те же поля, что в to_dict(), без объектов ORM
+user_rows = RowMapper('id', 'name', 'email', 'role', ('created_at', 'created_at', isoformat))
+
 def init_database():
     with app.app_context():
         try:
@@ -84,6 +93,31 @@ def init_database():
             db.session.rollback()
             raise e
 
+def check_database():
+    with app.app_context():
+        db.session.execute(text('SELECT 1'))
+        db.session.remove()
+
+# Фоновая проверка БД, /health отвечает из памяти
+health_monitor = HealthMonitor({'database': check_database}).start()
+
+# Сервисы, кэширующие профили: получают уведомление при изменении или удалении пользователя
+USER_CHANGE_SUBSCRIBERS = [
+    name for name in os.environ.get('USER_CHANGE_SUBSCRIBERS', 'confirmation').split(',') if name
+]
+
+def notify_user_changed(user_id):
+    """Рассылает сброс кэша подписчикам в фоне, не задерживая ответ администратору"""
+    def send():
+        for name in USER_CHANGE_SUBSCRIBERS:
+            try:
+                get_client(name).post(f'/invalidate_user/{user_id}', timeout=2)
+            except Exception as e:
+                # Запись в кэше подписчика все равно истечет по TTL
+                print(f"⚠ Не удалось уведомить {name} об изменении пользователя {user_id}: {e}")
+    
+    threading.Thread(target=send, daemon=True).start()
+
 # Основные эндпоинты (остальное без изменений)
 @app.route('/')
 def index():
@@ -199,10 +233,9 @@ def get_user(user_id):
 @app.route('/users', methods=['GET'])
 def get_all_users():
     try:
-        users = User.query.all()
-        users_list = [user.to_dict() for user in users]
+        users_list = user_rows.all(db.session.query(*user_rows.columns(User)))
         
-        return jsonify({
+        return json_response({
             'success': True,
             'total': len(users_list),
             'users': users_list
@@ -237,6 +270,7 @@ def update_user(user_id):
             user.role = data['role']
         
         db.session.commit()
+        notify_user_changed(user_id)
         
         return jsonify({
             'success': True,
@@ -263,6 +297,7 @@ def delete_user(user_id):
         
         db.session.delete(user)
         db.session.commit()
+        notify_user_changed(user_id)
         
         return jsonify({
             'success': True,
@@ -296,23 +331,10 @@ def get_admin_stats():
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    try:
-        db.session.execute('SELECT 1')
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'timestamp': datetime.utcnow().isoformat()
-        })
-    except Exception as e:
-        return jsonify({
-            'status': 'unhealthy',
-            'database': 'disconnected',
-            'error': str(e),
-            'timestamp': datetime.utcnow().isoformat()
-        }), 500
-    
-    
-    
+    health = health_monitor.snapshot()
+    database_ok = health['dependencies']['database'] == 'healthy'
+    health['database'] = 'connected' if database_ok else 'disconnected'
+    return jsonify(health), 200 if database_ok else 500
 
 if __name__ == '__main__':
     print("=" * 50)
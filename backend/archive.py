@@ -0,0 +1,154 @@
+import logging
+import os
+import threading
+import time
+from datetime import date as date_type, datetime, timedelta
+
+from sqlalchemy import Column, Index, Table, delete, func, insert, select, union_all
+
+logger = logging.getLogger(__name__)
+
+# Настройки переноса старых записей в архив
+ARCHIVE_CONFIG = {
+    'horizon_days': int(os.environ.get('ARCHIVE_HORIZON_DAYS', 180)),
+    'interval': float(os.environ.get('ARCHIVE_INTERVAL', 3600)),
+    'batch_size': int(os.environ.get('ARCHIVE_BATCH_SIZE', 1000))
+}
+
+
+def archive_table_for(table):
+    """Таблица <имя>_archive с теми же столбцами и индексами, что и горячая"""
+    name = f'{table.name}_archive'
+    archive = Table(
+        name, table.metadata,
+        *[Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable) for c in table.columns]
+    )
+    for index in table.indexes:
+        Index(
+            index.name.replace(table.name, name, 1),
+            *[archive.c[column.name] for column in index.columns],
+            unique=index.unique
+        )
+    return archive
+
+
+class Archiver:
+    """Фоновый перенос записей старше горизонта из горячих таблиц в архивные.
+
+    Горячая таблица остается маленькой и помещается в кэш страниц; запросы,
+    которым нужен период до горизонта, читают обе таблицы через source().
+    """
+
+    def __init__(self, app, db, config=None):
+        self.app = app
+        self.db = db
+        self.config = dict(ARCHIVE_CONFIG, **(config or {}))
+        self.tables = {}  # имя горячей таблицы -> (горячая, архивная, доп. условие)
+        self.archived_total = 0
+        self.last_run = None
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def register(self, model, where=None):
+        """Регистрирует модель; where - условие, без которого строка не переносится.
+        Вызывать до db.create_all(), чтобы архивная таблица была создана."""
+        table = model.__table__
+        self.tables[table.name] = (table, archive_table_for(table), where)
+        return self
+
+    def cutoff(self):
+        """Даты строго раньше этой лежат (или будут лежать) в архиве"""
+        return (datetime.now().date() - timedelta(days=self.config['horizon_days'])).isoformat()
+
+    def source(self, model, date_from=None):
+        """Источник строк модели: только горячая таблица, если период начинается
+        не раньше горизонта, иначе объединение горячей и архивной"""
+        table, archive, _ = self.tables[model.__table__.name]
+        try:
+            if date_from and date_type.fromisoformat(date_from).isoformat() >= self.cutoff():
+                return table
+        except (TypeError, ValueError):
+            pass
+        return union_all(select(table), select(archive)).subquery(f'{table.name}_all')
+
+    def start(self):
+        if self._thread is None and self.tables:
+            self._thread = threading.Thread(target=self._run, name='archiver', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Archiver error: {e}")
+            time.sleep(self.config['interval'])
+
+    def run_once(self):
+        """Один проход по всем таблицам; возвращает {таблица: перенесено строк}"""
+        moved = {}
+        with self._lock, self.app.app_context():
+            try:
+                cutoff = self.cutoff()
+                for name, (table, archive, where) in self.tables.items():
+                    moved[name] = 0
+                    while True:
+                        count = self._archive_batch(table, archive, where, cutoff)
+                        moved[name] += count
+                        if count < self.config['batch_size']:
+                            break
+            finally:
+                self.db.session.remove()
+        self.archived_total += sum(moved.values())
+        self.last_run = datetime.utcnow().isoformat()
+        self.last_error = None
+        if any(moved.values()):
+            logger.info(f"Archived: {moved}")
+        return moved
+
+    def _archive_batch(self, table, archive, where, cutoff):
+        """Переносит одну пачку строк одной транзакцией"""
+        session = self.db.session
+        conditions = [
+            table.c.date < cutoff,
+            # Строку с максимальным id не трогаем, чтобы SQLite не выдал ее id повторно
+            table.c.id < select(func.max(table.c.id)).scalar_subquery()
+        ]
+        if where is not None:
+            conditions.append(where)
+        try:
+            ids = session.execute(
+                select(table.c.id).where(*conditions).order_by(table.c.id).limit(self.config['batch_size'])
+            ).scalars().all()
+            if ids:
+                session.execute(insert(archive).from_select(
+                    [c.name for c in table.columns],
+                    select(table).where(table.c.id.in_(ids))
+                ))
+                session.execute(delete(table).where(table.c.id.in_(ids)))
+            session.commit()
+            return len(ids)
+        except Exception:
+            session.rollback()
+            raise
+
+    def stats(self):
+        """Счетчики архивации; вызывается внутри контекста приложения"""
+        tables = {
+            name: {
+                'hot_rows': self.db.session.execute(select(func.count()).select_from(table)).scalar(),
+                'archived_rows': self.db.session.execute(select(func.count()).select_from(archive)).scalar()
+            }
+            for name, (table, archive, _) in self.tables.items()
+        }
+        return {
+            'horizon_days': self.config['horizon_days'],
+            'cutoff': self.cutoff(),
+            'last_run': self.last_run,
+            'last_error': self.last_error,
+            'archived_total': self.archived_total,
+            'tables': tables
+        }
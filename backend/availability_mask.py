@@ -0,0 +1,120 @@
+import os
+
+# Шаг сетки в минутах: слоты и брони хранятся как биты по TICK_MINUTES минут
+TICK_MINUTES = int(os.environ.get('SCHEDULE_TICK_MINUTES', 15))
+TICKS_PER_DAY = 24 * 60 // TICK_MINUTES
+
+# Длительность одного сеанса по умолчанию
+SLOT_MINUTES = 60
+
+
+def time_to_tick(value):
+    """'HH:MM' -> номер тика от начала суток"""
+    hours, minutes = value.split(':')
+    return (int(hours) * 60 + int(minutes)) // TICK_MINUTES
+
+
+def tick_to_time(tick):
+    """Номер тика -> 'HH:MM'"""
+    minutes = tick * TICK_MINUTES
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+def span(start_tick, ticks):
+    """Маска из ticks подряд идущих битов, начиная с start_tick"""
+    return ((1 << ticks) - 1) << start_tick
+
+
+def iter_bits(mask):
+    """Номера установленных битов по возрастанию"""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class AvailabilityMask:
+    """Доступность мастера на один день в виде битовых масок.
+
+    working - тики рабочего времени, booked - занятые тики,
+    starts - тики, с которых может начинаться сеанс длиной slot_ticks.
+    """
+
+    __slots__ = ('working', 'booked', 'starts', 'slot_ticks')
+
+    def __init__(self, working=0, booked=0, starts=0, slot_ticks=SLOT_MINUTES // TICK_MINUTES):
+        self.working = working
+        self.booked = booked
+        self.starts = starts
+        self.slot_ticks = slot_ticks
+
+    @classmethod
+    def from_schedule(cls, all_slots, booked_times, slot_minutes=SLOT_MINUTES):
+        """Строит маску из списка начал сеансов и занятых времен 'HH:MM'"""
+        slot_ticks = slot_minutes // TICK_MINUTES
+        working = starts = booked = 0
+        for value in all_slots:
+            tick = time_to_tick(value)
+            starts |= 1 << tick
+            working |= span(tick, slot_ticks)
+        for value in booked_times:
+            booked |= span(time_to_tick(value), slot_ticks)
+        return cls(working, booked & working, starts, slot_ticks)
+
+    @property
+    def free(self):
+        """Свободные тики рабочего времени"""
+        return self.working & ~self.booked
+
+    @property
+    def free_starts(self):
+        """Начала сеансов, у которых свободен весь интервал"""
+        free = self.free
+        result = self.starts
+        for offset in range(self.slot_ticks):
+            result &= free >> offset
+        return result
+
+    def available_times(self):
+        return [tick_to_time(tick) for tick in iter_bits(self.free_starts)]
+
+    def booked_times(self):
+        """Начала сеансов, пересекающихся с занятым временем"""
+        return [tick_to_time(tick) for tick in iter_bits(self.starts & ~self.free_starts)]
+
+    def all_slots(self):
+        return [tick_to_time(tick) for tick in iter_bits(self.starts)]
+
+    def is_free(self, value):
+        return bool((self.free_starts >> time_to_tick(value)) & 1)
+
+    def first_free_at_or_after(self, value):
+        """Первое свободное начало сеанса не раньше value или None"""
+        tick = time_to_tick(value)
+        candidates = self.free_starts >> tick
+        if not candidates:
+            return None
+        return tick_to_time(tick + (candidates & -candidates).bit_length() - 1)
+
+    def __and__(self, other):
+        """Время, когда свободны оба мастера"""
+        common = AvailabilityMask(
+            self.working & other.working,
+            self.booked | other.booked,
+            self.starts & other.starts,
+            max(self.slot_ticks, other.slot_ticks)
+        )
+        common.booked &= common.working
+        return common
+
+    def to_compact(self):
+        """Компактное представление для внутренних клиентов (hex-строки масок)"""
+        return {
+            'w': format(self.working, 'x'),
+            'b': format(self.booked, 'x'),
+            's': format(self.starts, 'x')
+        }
+
+    @classmethod
+    def from_compact(cls, data, slot_ticks=SLOT_MINUTES // TICK_MINUTES):
+        return cls(int(data['w'], 16), int(data['b'], 16), int(data['s'], 16), slot_ticks)
@@ -0,0 +1,112 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from flask import Flask, jsonify
+
+from serialization import JSON_BACKEND, RowMapper, isoformat, json_response
+from sqlite_engine import create_sqlite_db
+from typed_columns import DayNumber, MinuteOfDay
+
+
+def build_app(db_path, rows):
+    """Приложение с таблицей как у Confirmation Service, заполненной rows записями"""
+    app = Flask(__name__)
+    db = create_sqlite_db(app, db_path)
+
+    class Booking(db.Model):
+        __tablename__ = 'bookings'
+        id = db.Column(db.Integer, primary_key=True)
+        user_id = db.Column(db.Integer, nullable=False)
+        user_name = db.Column(db.String(100))
+        master_id = db.Column(db.Integer, nullable=False)
+        master_name = db.Column(db.String(100))
+        date = db.Column(DayNumber, nullable=False)
+        time = db.Column(MinuteOfDay, nullable=False)
+        created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    with app.app_context():
+        db.create_all()
+        start = datetime(2025, 1, 1)
+        db.session.execute(Booking.__table__.insert(), [{
+            'user_id': i % 500,
+            'user_name': f'Клиент #{i % 500}',
+            'master_id': i % 7,
+            'master_name': f'Мастер #{i % 7}',
+            'date': (start + timedelta(days=i % 365)).date().isoformat(),
+            'time': f'{10 + i % 8:02d}:00',
+            'created_at': start + timedelta(minutes=i)
+        } for i in range(rows)])
+        db.session.commit()
+    return app, db, Booking
+
+
+def measure(app, db, repeat, run):
+    """Лучшее время run() из repeat запусков, в секундах"""
+    best = None
+    with app.app_context():
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+            db.session.remove()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Стоимость сериализации строки в списковых ответах')
+    parser.add_argument('--rows', type=int, default=20000, help='Число строк в таблице')
+    parser.add_argument('--repeat', type=int, default=5, help='Число повторов (берется лучший)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app, db, Booking = build_app(os.path.join(tmp, 'bench.db'), args.rows)
+        booking_rows = RowMapper(
+            'id', 'user_id', ('user', 'user_name'), 'master_id', ('master', 'master_name'),
+            'date', 'time', ('created_at', 'created_at', isoformat)
+        )
+
+        def before():
+            # Как было: объекты ORM, словари в цикле, jsonify
+            result = []
+            for b in Booking.query.all():
+                result.append({
+                    'id': b.id,
+                    'user_id': b.user_id,
+                    'user': b.user_name,
+                    'master_id': b.master_id,
+                    'master': b.master_name,
+                    'date': b.date,
+                    'time': b.time,
+                    'created_at': b.created_at.isoformat() if b.created_at else None
+                })
+            return jsonify({'success': True, 'bookings': result}).get_data()
+
+        def after():
+            # Проекция столбцов, собранный маппер, быстрый кодировщик
+            result = booking_rows.all(Booking.query.with_entities(*booking_rows.columns(Booking)))
+            return json_response({'success': True, 'bookings': result}).get_data()
+
+        print("=" * 60)
+        print(f"⏱ Сериализация {args.rows} строк, лучший из {args.repeat}, JSON: {JSON_BACKEND}")
+        print("=" * 60)
+
+        with app.app_context():
+            if json.loads(before()) != json.loads(after()):
+                print("❌ Ответы до и после различаются")
+                return 1
+        timings = {}
+        for title, run in (('до', before), ('после', after)):
+            timings[title] = measure(app, db, args.repeat, run)
+            print(f"   {title:>6}: {timings[title] * 1000:8.1f} мс, {timings[title] / args.rows * 1e6:6.2f} мкс/строка")
+        print(f"✅ Ускорение: {timings['до'] / timings['после']:.1f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,160 @@
+import argparse
+import importlib.util
+import os
+import sys
+from datetime import date as date_type
+
+from sqlalchemy import select
+
+from pagination import LIST_PAGE_SIZE, keyset_page
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+SAMPLE_DATE = '2025-01-01'
+SAMPLE_CURSOR = (SAMPLE_DATE, '10:00', 1)
+
+
+def recent(service, model):
+    """Источник истории для периода после горизонта архивации - горячая таблица"""
+    return service.archiver.source(model, date_type.today().isoformat())
+
+
+def history(service, model):
+    """Источник истории без начала периода - горячая таблица вместе с архивом"""
+    return service.archiver.source(model)
+
+
+def visits_page(service, source):
+    """Страница /master_visit_history из источника source"""
+    return keyset_page(
+        source.c, service.master_visits_query(source, 1), SAMPLE_CURSOR, descending=True, limit=LIST_PAGE_SIZE + 1
+    )
+
+
+def primary_key_lookup(model, value):
+    """Запрос, который выполняет db.session.get(model, value)"""
+    (key,) = model.__mapper__.primary_key
+    return select(model).where(key == value)
+
+
+# (сервис, описание, построение запроса из модуля сервиса, подходящие индексы, запрос с ORDER BY).
+# Запросы берутся из тех же функций, что и в обработчиках, поэтому не расходятся с кодом
+HOT_QUERIES = [
+    ('Master_Service', 'расписание мастера на день',
+     lambda s: s.booked_times_query(1, SAMPLE_DATE),
+     ('ux_booked_slots_master_date_time', 'ix_booked_slots_date_master'), False),
+    ('Master_Service', 'расписание мастера на диапазон',
+     lambda s: s.booked_range_query(1, SAMPLE_DATE, '2025-01-07'),
+     'ux_booked_slots_master_date_time', False),
+    ('Master_Service', 'доступность всех мастеров на диапазон',
+     lambda s: s.booked_in_range_query(SAMPLE_DATE, '2025-01-07'),
+     'ix_booked_slots_date_master', False),
+    ('Master_Service', 'общее расписание мастеров',
+     lambda s: s.booked_for_masters_query([1, 2], SAMPLE_DATE),
+     ('ux_booked_slots_master_date_time', 'ix_booked_slots_date_master'), False),
+    ('Master_Service', 'свободные мастера на дату',
+     lambda s: s.booked_on_date_query(SAMPLE_DATE),
+     'ix_booked_slots_date_master', False),
+    ('Master_Service', 'страница записей мастера',
+     lambda s: keyset_page(s.BookedSlot, s.master_bookings_query(1), SAMPLE_CURSOR, limit=LIST_PAGE_SIZE + 1),
+     'ux_booked_slots_master_date_time', True),
+    ('Master_Service', 'страница истории мастера',
+     lambda s: visits_page(s, recent(s, s.MasterVisitHistory)),
+     'ix_master_visit_history_master_date_time', True),
+    ('Master_Service', 'страница истории мастера с архивом',
+     lambda s: visits_page(s, history(s, s.MasterVisitHistory)),
+     ('ix_master_visit_history_master_date_time', 'ix_master_visit_history_archive_master_date_time'), True),
+    ('Confirmation_Service', 'записи пользователя',
+     lambda s: s.user_bookings_query(1),
+     'ix_bookings_user_date_time', True),
+    ('Confirmation_Service', 'записи мастера',
+     lambda s: s.master_bookings_query(1),
+     'ix_bookings_master_date_time', True),
+    ('Confirmation_Service', 'страница всех активных записей',
+     lambda s: keyset_page(s.Booking, s.active_bookings_query(), SAMPLE_CURSOR, descending=True,
+                           limit=LIST_PAGE_SIZE + 1),
+     'ix_bookings_date_time', True),
+    ('Confirmation_Service', 'страница активных записей мастера',
+     lambda s: keyset_page(s.Booking, s.active_bookings_query(master_id=1), SAMPLE_CURSOR, descending=True,
+                           limit=LIST_PAGE_SIZE + 1),
+     'ix_bookings_master_date_time', True),
+    ('Confirmation_Service', 'страница активных записей пользователя',
+     lambda s: keyset_page(s.Booking, s.active_bookings_query(user_id=1), SAMPLE_CURSOR, descending=True,
+                           limit=LIST_PAGE_SIZE + 1),
+     'ix_bookings_user_date_time', True),
+    ('Confirmation_Service', 'проверка дублей пакета',
+     lambda s: s.existing_bookings_query([1, 2], [SAMPLE_DATE, '2025-01-02']),
+     'ix_bookings_user_date_time', False),
+    ('History_Service', 'сеансы пользователя за неделю',
+     lambda s: s.user_sessions_query(recent(s, s.SessionHistory), 1, SAMPLE_DATE),
+     'ix_session_history_user_session_date', True),
+    ('History_Service', 'сводка посещений для рекомендации',
+     lambda s: primary_key_lookup(s.UserVisitSummary, 1),
+     'INTEGER PRIMARY KEY', False),
+]
+
+
+def load_service(backend_dir, name):
+    """Импортирует app.py сервиса; при импорте сервис создает и переводит свою базу"""
+    spec = importlib.util.spec_from_file_location(f'{name.lower()}_app', os.path.join(backend_dir, name, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def compile_query(service, query):
+    """SQL запроса с подставленными значениями, как его выполнит SQLite"""
+    statement = getattr(query, 'statement', query)
+    return str(statement.compile(dialect=service.db.engine.dialect, compile_kwargs={'literal_binds': True}))
+
+
+def check_plans(backend_dir):
+    """Проверяет EXPLAIN QUERY PLAN горячих запросов; возвращает список проблем"""
+    problems = []
+    services = {}
+    for name, title, build, indexes, ordered in HOT_QUERIES:
+        if isinstance(indexes, str):
+            indexes = (indexes,)
+        if name not in services:
+            services[name] = load_service(backend_dir, name)
+        service = services[name]
+
+        with service.app.app_context():
+            try:
+                sql = compile_query(service, build(service))
+                with service.db.engine.connect() as connection:
+                    plan = [row[3] for row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {sql}')]
+            except Exception as e:
+                problems.append(f'{title}: {e}')
+                continue
+
+        text = '; '.join(plan)
+        ok = any(index in text for index in indexes) and not (ordered and 'TEMP B-TREE' in text)
+        print(f"{'✅' if ok else '❌'} {title}: {text}")
+        if not ok:
+            print(f"   {sql}")
+            problems.append(f'{title}: ожидался индекс {" или ".join(indexes)} без сортировки во временном дереве')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проверка использования индексов горячими запросами')
+    parser.add_argument('--backend', default=BACKEND_DIR, help='Каталог с сервисами')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("🔍 Планы горячих запросов (запросы строятся кодом сервисов)")
+    print("=" * 60)
+
+    problems = check_plans(args.backend)
+    if problems:
+        print(f"❌ Проблем: {len(problems)}")
+        for problem in problems:
+            print(f"   {problem}")
+        return 1
+    print("✅ Все горячие запросы используют индексы")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+
+# Пороги по умолчанию (можно переопределить переменными окружения)
+CIRCUIT_BREAKER_CONFIG = {
+    'window': int(os.environ.get('CB_WINDOW', 20)),
+    'min_calls': int(os.environ.get('CB_MIN_CALLS', 5)),
+    'failure_rate': float(os.environ.get('CB_FAILURE_RATE', 0.5)),
+    'slow_call_duration': float(os.environ.get('CB_SLOW_CALL_DURATION', 2.0)),
+    'slow_call_rate': float(os.environ.get('CB_SLOW_CALL_RATE', 0.8)),
+    'open_timeout': float(os.environ.get('CB_OPEN_TIMEOUT', 10.0)),
+    'half_open_calls': int(os.environ.get('CB_HALF_OPEN_CALLS', 3))
+}
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Вызов отклонен: цепь разомкнута"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'Сервис {name} временно недоступен')
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Автоматический выключатель для одной зависимости.
+
+    closed    - вызовы проходят, исходы пишутся в скользящее окно;
+    open      - вызовы сразу отклоняются CircuitOpenError до истечения open_timeout;
+    half_open - пропускается half_open_calls пробных вызовов: если все успешны,
+                цепь замыкается, при первой ошибке снова размыкается.
+    Цепь размыкается, когда в окне не меньше min_calls вызовов и доля ошибок
+    или медленных (дольше slow_call_duration) вызовов превышает порог.
+    """
+
+    def __init__(self, name, config=None):
+        self.name = name
+        self.config = dict(CIRCUIT_BREAKER_CONFIG, **(config or {}))
+        self.state = CLOSED
+        self.opened_at = None
+        self.outcomes = deque(maxlen=self.config['window'])  # (ok, slow)
+        self.half_open_in_flight = 0
+        self.half_open_successes = 0
+        self.rejected_total = 0
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Проверяет, можно ли выполнить вызов; иначе CircuitOpenError"""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self.opened_at + self.config['open_timeout'] - time.monotonic()
+                if remaining > 0:
+                    self.rejected_total += 1
+                    raise CircuitOpenError(self.name, math.ceil(remaining))
+                self.state = HALF_OPEN
+                self.half_open_in_flight = 0
+                self.half_open_successes = 0
+
+            if self.state == HALF_OPEN:
+                if self.half_open_in_flight >= self.config['half_open_calls']:
+                    self.rejected_total += 1
+                    raise CircuitOpenError(self.name, 1)
+                self.half_open_in_flight += 1
+
+    def record(self, ok, duration):
+        """Учитывает исход вызова, разрешенного before_call"""
+        slow = duration >= self.config['slow_call_duration']
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self.half_open_in_flight -= 1
+                if not ok or slow:
+                    self._open()
+                else:
+                    self.half_open_successes += 1
+                    if self.half_open_successes >= self.config['half_open_calls']:
+                        self.state = CLOSED
+                        self.outcomes.clear()
+                return
+
+            if self.state == OPEN:
+                return
+
+            self.outcomes.append((ok, slow))
+            if len(self.outcomes) >= self.config['min_calls'] and self._should_open():
+                self._open()
+
+    def _should_open(self):
+        total = len(self.outcomes)
+        failures = sum(1 for ok, _ in self.outcomes if not ok)
+        slow_calls = sum(1 for _, slow in self.outcomes if slow)
+        return (failures / total >= self.config['failure_rate']
+                or slow_calls / total >= self.config['slow_call_rate'])
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.outcomes.clear()
+
+    def snapshot(self):
+        with self._lock:
+            total = len(self.outcomes)
+            retry_after = None
+            if self.state == OPEN:
+                retry_after = max(math.ceil(self.opened_at + self.config['open_timeout'] - time.monotonic()), 0)
+            return {
+                'state': self.state,
+                'calls_in_window': total,
+                'failure_rate': round(sum(1 for ok, _ in self.outcomes if not ok) / total, 3) if total else None,
+                'slow_call_rate': round(sum(1 for _, slow in self.outcomes if slow) / total, 3) if total else None,
+                'retry_after': retry_after,
+                'rejected_total': self.rejected_total
+            }
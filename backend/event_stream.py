@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import Column, Float, Integer, String, Table, Text, delete, event, func, insert, select
+
+logger = logging.getLogger(__name__)
+
+# Настройки публикации событий (можно переопределить переменными окружения)
+EVENT_STREAM_CONFIG = {
+    'batch_size': int(os.environ.get('EVENT_STREAM_BATCH_SIZE', 200)),
+    'poll_interval': float(os.environ.get('EVENT_STREAM_POLL_INTERVAL', 1.0)),
+    'backoff_base': 0.5,
+    'backoff_max': 60.0
+}
+
+
+class EventPublisher:
+    """Упорядоченный поток событий сервиса с пакетной доставкой потребителю.
+
+    emit() пишет событие в таблицу <name> на соединении текущей транзакции,
+    поэтому событие появляется только вместе с изменением, которое его вызвало.
+    Номер события (seq) - AUTOINCREMENT: запись в SQLite выполняет один писатель
+    за раз, так что порядок seq совпадает с порядком фиксации транзакций.
+
+    Фоновый поток отправляет события пачками по возрастанию seq функции
+    deliver(stream_id, events) и удаляет их после успешной доставки. При ошибке
+    пачка повторяется целиком с экспоненциальной задержкой, поэтому потребитель
+    должен отбрасывать уже обработанные seq. stream_id меняется при пересоздании
+    базы, чтобы потребитель начал отсчет seq заново.
+    """
+
+    def __init__(self, app, db, name, deliver, config=None):
+        self.app = app
+        self.db = db
+        self.deliver = deliver
+        self.config = dict(EVENT_STREAM_CONFIG, **(config or {}))
+        # Создаются вместе с остальными таблицами в db.create_all()
+        self.table = Table(
+            name, db.metadata,
+            Column('seq', Integer, primary_key=True),
+            Column('event_type', String(50), nullable=False),
+            Column('payload', Text, nullable=False),
+            Column('created_at', Float, nullable=False),
+            sqlite_autoincrement=True
+        )
+        self.stream_table = Table(
+            f'{name}_stream', db.metadata,
+            Column('id', Integer, primary_key=True),
+            Column('stream_id', String(36), nullable=False)
+        )
+        self.stream_id = None
+        self.published_total = 0
+        self.last_published_seq = None
+        self.last_error = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        # Новые события видны потоку после фиксации - будим его сразу, не дожидаясь опроса
+        event.listen(db.session, 'after_commit', lambda session: self._wakeup.set())
+
+    def emit(self, connection, event_type, payload):
+        """Добавляет событие в текущую транзакцию (вызывать из событий модели или
+        на соединении сессии до commit)"""
+        connection.execute(insert(self.table).values(
+            event_type=event_type,
+            payload=json.dumps(payload, ensure_ascii=False),
+            created_at=time.time()
+        ))
+
+    def start(self):
+        """Запускает доставку; вызывать после создания таблиц"""
+        if self._thread is not None:
+            return self
+        with self.app.app_context():
+            try:
+                self.stream_id = self._load_stream_id()
+            finally:
+                self.db.session.remove()
+        self._thread = threading.Thread(target=self._run, name=f'{self.table.name}-publisher', daemon=True)
+        self._thread.start()
+        return self
+
+    def _load_stream_id(self):
+        session = self.db.session
+        stream_id = session.execute(select(self.stream_table.c.stream_id)).scalar()
+        if stream_id is None:
+            stream_id = str(uuid.uuid4())
+            session.execute(insert(self.stream_table).values(id=1, stream_id=stream_id))
+            session.commit()
+        return stream_id
+
+    def _run(self):
+        failures = 0
+        while True:
+            try:
+                published = self.publish_batch()
+                failures = 0
+                self.last_error = None
+            except Exception as e:
+                failures += 1
+                self.last_error = str(e)
+                logger.warning(f"Event stream {self.table.name}: доставка не удалась ({e}), будет повтор")
+                time.sleep(min(self.config['backoff_base'] * (2 ** (failures - 1)), self.config['backoff_max']))
+                continue
+            # Если пачка была полной, сразу берем следующую
+            if published < self.config['batch_size']:
+                self._wakeup.wait(self.config['poll_interval'])
+                self._wakeup.clear()
+
+    def publish_batch(self):
+        """Доставляет одну пачку событий; возвращает ее размер"""
+        with self.app.app_context():
+            session = self.db.session
+            try:
+                rows = session.execute(
+                    select(self.table).order_by(self.table.c.seq).limit(self.config['batch_size'])
+                ).all()
+                session.rollback()
+                if not rows:
+                    return 0
+
+                events = [
+                    dict(json.loads(row.payload), seq=row.seq, type=row.event_type)
+                    for row in rows
+                ]
+                self.deliver(self.stream_id, events)
+
+                last_seq = rows[-1].seq
+                session.execute(delete(self.table).where(self.table.c.seq <= last_seq))
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise
+            finally:
+                session.remove()
+        self.published_total += len(rows)
+        self.last_published_seq = last_seq
+        return len(rows)
+
+    def stats(self):
+        """Глубина очереди и счетчики доставки; вызывается внутри контекста приложения"""
+        pending, oldest = self.db.session.execute(
+            select(func.count(), func.min(self.table.c.created_at))
+        ).one()
+        return {
+            'stream_id': self.stream_id,
+            'pending': pending,
+            'oldest_pending_age': round(time.time() - oldest, 3) if oldest else 0,
+            'published_total': self.published_total,
+            'last_published_seq': self.last_published_seq,
+            'last_error': self.last_error,
+            'worker_running': self._thread is not None and self._thread.is_alive()
+        }
@@ -0,0 +1,129 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Настройки фоновой проверки зависимостей
+HEALTH_CONFIG = {
+    'interval': float(os.environ.get('HEALTH_CHECK_INTERVAL', 5.0)),
+    'timeout': float(os.environ.get('HEALTH_CHECK_TIMEOUT', 2.0)),
+    'window': int(os.environ.get('HEALTH_CHECK_WINDOW', 120))
+}
+
+
+class DependencyUnhealthy(Exception):
+    """Зависимость ответила, но с ошибкой"""
+
+
+def http_check(client, path='/'):
+    """Проверка HTTP-зависимости: ответ 200 на GET path"""
+    def check():
+        # Проверки не проходят через выключатель и не влияют на его статистику
+        response = client.get(path, timeout=HEALTH_CONFIG['timeout'], use_breaker=False)
+        if response.status_code != 200:
+            raise DependencyUnhealthy(f'HTTP {response.status_code}')
+    return check
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[int(round(fraction * (len(sorted_values) - 1)))]
+
+
+class DependencyStats:
+    """Скользящая статистика проверок одной зависимости"""
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)  # (latency_ms, ok)
+        self.status = 'unknown'
+        self.error = None
+        self.last_checked = None
+        self.consecutive_failures = 0
+
+    def record(self, latency_ms, status, error=None):
+        self.samples.append((latency_ms, status == 'healthy'))
+        self.status = status
+        self.error = error
+        self.last_checked = datetime.utcnow().isoformat()
+        self.consecutive_failures = 0 if status == 'healthy' else self.consecutive_failures + 1
+
+    def snapshot(self):
+        samples = list(self.samples)
+        latencies = sorted(latency for latency, _ in samples)
+        errors = sum(1 for _, ok in samples if not ok)
+        return {
+            'status': self.status,
+            'error': self.error,
+            'last_checked': self.last_checked,
+            'consecutive_failures': self.consecutive_failures,
+            'error_rate': round(errors / len(samples), 3) if samples else None,
+            'latency_ms': {
+                'p50': percentile(latencies, 0.5),
+                'p99': percentile(latencies, 0.99)
+            },
+            'samples': len(samples)
+        }
+
+
+class HealthMonitor:
+    """Фоновая параллельная проверка зависимостей с ответом /health из памяти"""
+
+    def __init__(self, checks, config=None):
+        self.checks = checks  # имя -> функция; исключение означает проблему
+        self.config = dict(HEALTH_CONFIG, **(config or {}))
+        self.stats = {name: DependencyStats(self.config['window']) for name in checks}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(len(checks), 1),
+            thread_name_prefix='health'
+        )
+        self._thread = None
+
+    def start(self):
+        if self._thread is None and self.checks:
+            self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self.probe_all()
+            except Exception as e:
+                logger.error(f"Health monitor error: {e}")
+            time.sleep(max(self.config['interval'] - (time.monotonic() - started), 0))
+
+    def _probe(self, name):
+        started = time.perf_counter()
+        try:
+            self.checks[name]()
+            status, error = 'healthy', None
+        except DependencyUnhealthy as e:
+            status, error = 'unhealthy', str(e)
+        except Exception as e:
+            status, error = 'unreachable', str(e)
+        latency_ms = round((time.perf_counter() - started) * 1000, 2)
+        with self._lock:
+            self.stats[name].record(latency_ms, status, error)
+
+    def probe_all(self):
+        """Один цикл проверки всех зависимостей параллельно"""
+        list(self._executor.map(self._probe, self.checks))
+
+    def snapshot(self):
+        with self._lock:
+            dependencies = {name: stats.snapshot() for name, stats in self.stats.items()}
+        all_healthy = all(d['status'] == 'healthy' for d in dependencies.values())
+        return {
+            'status': 'healthy' if all_healthy else 'degraded',
+            'timestamp': datetime.utcnow().isoformat(),
+            'dependencies': {name: d['status'] for name, d in dependencies.items()},
+            'details': dependencies
+        }
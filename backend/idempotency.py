@@ -0,0 +1,113 @@
+import hashlib
+import os
+import threading
+from functools import wraps
+
+from flask import jsonify, make_response, request
+
+from cache import LRUCache
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+
+# Настройки хранилища результатов (можно переопределить переменными окружения)
+IDEMPOTENCY_CONFIG = {
+    'maxsize': int(os.environ.get('IDEMPOTENCY_MAX_KEYS', 10000)),
+    'ttl': float(os.environ.get('IDEMPOTENCY_TTL', 24 * 3600)),
+    # Сколько повтор ждет завершения исходного запроса с тем же ключом
+    'wait_timeout': float(os.environ.get('IDEMPOTENCY_WAIT_TIMEOUT', 10)),
+    'max_key_length': 255
+}
+
+
+class IdempotencyStore:
+    """Результаты запросов с заголовком Idempotency-Key в памяти процесса.
+
+    Завершенный ответ (кроме 5xx) сохраняется на ttl и отдается повтору
+    с тем же ключом без повторного выполнения обработчика. Повтор, пришедший
+    пока исходный запрос еще выполняется, ждет его результата. Тот же ключ
+    с другим телом запроса отклоняется с 422.
+    """
+
+    def __init__(self, config=None):
+        self.config = dict(IDEMPOTENCY_CONFIG, **(config or {}))
+        self.results = LRUCache(maxsize=self.config['maxsize'], ttl=self.config['ttl'])
+        self.replays = 0
+        self.mismatches = 0
+        self._in_flight = {}  # ключ -> threading.Event
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Возвращает (сохраненный результат, None) или (None, событие завершения);
+        событие получает только первый запрос с ключом, остальные ждут его"""
+        while True:
+            stored = self.results.get(key)
+            if stored is not None:
+                return stored, None
+            with self._lock:
+                waiting = self._in_flight.get(key)
+                if waiting is None:
+                    done = self._in_flight[key] = threading.Event()
+                    return None, done
+            if not waiting.wait(self.config['wait_timeout']):
+                return None, None
+
+    def finish(self, key, done, result=None):
+        if result is not None:
+            self.results.set(key, result)
+        with self._lock:
+            self._in_flight.pop(key, None)
+        done.set()
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._in_flight)
+        return dict(self.results.stats(), replays=self.replays, mismatches=self.mismatches, in_flight=in_flight)
+
+
+def request_fingerprint():
+    return hashlib.sha256(request.method.encode() + request.path.encode() + request.get_data()).hexdigest()
+
+
+def idempotent(store):
+    """Декоратор маршрута: повтор с тем же Idempotency-Key получает сохраненный ответ.
+    Запросы без заголовка обрабатываются как обычно"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if request.method == 'OPTIONS' or not key:
+                return f(*args, **kwargs)
+            if len(key) > store.config['max_key_length']:
+                return jsonify({'error': f'Слишком длинный {IDEMPOTENCY_HEADER}'}), 400
+
+            store_key = (request.path, key)
+            fingerprint = request_fingerprint()
+            stored, done = store.begin(store_key)
+            if stored is not None:
+                return replay(store, stored, fingerprint)
+            if done is None:
+                return jsonify({'error': 'Запрос с этим ключом еще выполняется'}), 409
+
+            result = None
+            try:
+                response = make_response(f(*args, **kwargs))
+                # 5xx - временная ошибка, повтор должен выполниться заново
+                if response.status_code < 500 and not response.is_streamed:
+                    result = (fingerprint, response.status_code, response.mimetype, response.get_data())
+                return response
+            finally:
+                store.finish(store_key, done, result)
+        return decorated_function
+    return decorator
+
+
+def replay(store, stored, fingerprint):
+    stored_fingerprint, status, mimetype, body = stored
+    if stored_fingerprint != fingerprint:
+        store.mismatches += 1
+        return jsonify({'error': f'{IDEMPOTENCY_HEADER} уже использован с другими параметрами'}), 422
+    store.replays += 1
+    response = make_response(body, status)
+    response.mimetype = mimetype
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
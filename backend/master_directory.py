@@ -0,0 +1,73 @@
+import logging
+import os
+import threading
+import time
+
+from circuit_breaker import CircuitOpenError
+from service_client import get_client
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд запись о мастере считается свежей без перепроверки
+MASTER_CACHE_TTL = float(os.environ.get('MASTER_CACHE_TTL', 60))
+
+
+class MasterDirectory:
+    """Кэш мастеров по id с TTL и перепроверкой через If-None-Match"""
+
+    def __init__(self, client=None, ttl=MASTER_CACHE_TTL):
+        self.client = client or get_client('master')
+        self.ttl = ttl
+        self._entries = {}  # master_id -> (master, etag, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, master_id):
+        """Возвращает {'id', 'name'} или None, если мастер не найден"""
+        master_id = int(master_id)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(master_id)
+        if entry and entry[2] > now:
+            return entry[0]
+
+        headers = {'If-None-Match': entry[1]} if entry and entry[1] else {}
+        try:
+            response = self.client.get(f'/masters/{master_id}', headers=headers)
+        except CircuitOpenError:
+            if entry:
+                return entry[0]
+            raise
+        except Exception as e:
+            logger.error(f"Error getting master {master_id}: {e}")
+            # Если Master Service недоступен, отдаем устаревшую запись
+            return entry[0] if entry else None
+
+        if response.status_code == 304 and entry:
+            master, etag = entry[0], entry[1]
+        elif response.status_code == 200:
+            master, etag = response.json(), response.headers.get('ETag')
+        else:
+            if response.status_code == 404:
+                self.invalidate(master_id)
+            return None
+
+        with self._lock:
+            self._entries[master_id] = (master, etag, now + self.ttl)
+        return master
+
+    def get_name(self, master_id, default=None):
+        master = self.get(master_id)
+        if master:
+            return master.get('name') or default
+        return default
+
+    def invalidate(self, master_id=None):
+        with self._lock:
+            if master_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(int(master_id), None)
+
+
+master_directory = MasterDirectory()
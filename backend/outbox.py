@@ -0,0 +1,173 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Настройки доставки по умолчанию
+OUTBOX_CONFIG = {
+    'batch_size': 50,
+    'poll_interval': 1.0,
+    'max_attempts': 10,
+    'backoff_base': 0.5,
+    'backoff_max': 300.0
+}
+
+
+class Outbox:
+    """Надежная локальная очередь побочных эффектов (SQLite) с фоновой доставкой.
+
+    Событие сначала записывается в таблицу outbox, а фоновый поток забирает
+    готовые события пачками и передает их обработчикам по типу события.
+    Неудачная доставка повторяется с экспоненциальной задержкой, после
+    max_attempts попыток событие помечается как 'dead'.
+    """
+
+    def __init__(self, db_path, config=None):
+        self.db_path = db_path
+        self.config = dict(OUTBOX_CONFIG, **(config or {}))
+        self.handlers = {}
+        self.delivered_total = 0
+        self.failed_total = 0
+        self._wakeup = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._init_db()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS ix_outbox_status_next '
+                'ON outbox (status, next_attempt_at)'
+            )
+
+    def register(self, event_type, handler):
+        """Регистрирует обработчик handler(payload); исключение означает неудачу"""
+        self.handlers[event_type] = handler
+
+    def add(self, event_type, payload):
+        """Записывает событие в outbox и будит фоновый поток"""
+        self.add_many(event_type, [payload])
+
+    def add_many(self, event_type, payloads):
+        """Записывает несколько событий одного типа одной транзакцией"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                'INSERT INTO outbox (event_type, payload, next_attempt_at, created_at) '
+                'VALUES (?, ?, ?, ?)',
+                [(event_type, json.dumps(payload, ensure_ascii=False), now, now) for payload in payloads]
+            )
+        self.start()
+        self._wakeup.set()
+
+    def start(self):
+        """Запускает фоновый поток доставки (повторный вызов ничего не делает)"""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='outbox-worker', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                delivered = self.process_batch()
+            except Exception as e:
+                logger.error(f"Outbox worker error: {e}")
+                delivered = 0
+            # Если пачка была полной, сразу берем следующую
+            if delivered < self.config['batch_size']:
+                self._wakeup.wait(self.config['poll_interval'])
+                self._wakeup.clear()
+
+    def process_batch(self):
+        """Доставляет одну пачку готовых событий; возвращает ее размер"""
+        now = time.time()
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, event_type, payload, attempts FROM outbox "
+                "WHERE status = 'pending' AND next_attempt_at <= ? "
+                "ORDER BY id LIMIT ?",
+                (now, self.config['batch_size'])
+            ).fetchall()
+
+        if not rows:
+            return 0
+
+        delivered_ids = []
+        failures = []
+        for event_id, event_type, payload, attempts in rows:
+            handler = self.handlers.get(event_type)
+            try:
+                if handler is None:
+                    raise LookupError(f'Нет обработчика для {event_type}')
+                handler(json.loads(payload))
+                delivered_ids.append((event_id,))
+            except Exception as e:
+                failures.append((event_id, attempts + 1, str(e)))
+
+        with self._connect() as conn:
+            conn.executemany('DELETE FROM outbox WHERE id = ?', delivered_ids)
+            for event_id, attempts, error in failures:
+                if attempts >= self.config['max_attempts']:
+                    status, next_attempt_at = 'dead', now
+                else:
+                    status = 'pending'
+                    delay = min(self.config['backoff_base'] * (2 ** (attempts - 1)), self.config['backoff_max'])
+                    next_attempt_at = now + delay
+                conn.execute(
+                    'UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? '
+                    'WHERE id = ?',
+                    (status, attempts, next_attempt_at, error, event_id)
+                )
+
+        self.delivered_total += len(delivered_ids)
+        self.failed_total += len(failures)
+        if failures:
+            logger.warning(f"Outbox: {len(failures)} событий не доставлено, будет повтор")
+        return len(rows)
+
+    def stats(self):
+        """Глубина очереди и счетчики доставки"""
+        with self._connect() as conn:
+            counts = dict(conn.execute(
+                'SELECT status, COUNT(*) FROM outbox GROUP BY status'
+            ).fetchall())
+            oldest = conn.execute(
+                "SELECT MIN(created_at) FROM outbox WHERE status = 'pending'"
+            ).fetchone()[0]
+        return {
+            'pending': counts.get('pending', 0),
+            'dead': counts.get('dead', 0),
+            'oldest_pending_age': round(time.time() - oldest, 3) if oldest else 0,
+            'delivered_total': self.delivered_total,
+            'failed_total': self.failed_total,
+            'worker_running': self._thread is not None and self._thread.is_alive()
+        }
@@ -0,0 +1,92 @@
+import base64
+import json
+from datetime import date as date_type
+from itertools import islice
+
+from flask import Response, jsonify, request, stream_with_context
+from sqlalchemy import literal, tuple_
+
+from serialization import dumps, json_response
+
+# Постраничная выдача списков
+LIST_PAGE_SIZE = 100
+MAX_LIST_PAGE_SIZE = 1000
+LIST_STREAM_BATCH_SIZE = 1000
+
+
+def encode_cursor(row):
+    """Непрозрачный курсор по ключу (date, time, id) последней выданной строки"""
+    return base64.urlsafe_b64encode(json.dumps([row.date, row.time, row.id]).encode()).decode()
+
+
+def decode_cursor(value):
+    date, time, row_id = json.loads(base64.urlsafe_b64decode(value.encode()))
+    return str(date), str(time), int(row_id)
+
+
+def keyset_page(model, query, after=None, descending=False, limit=LIST_STREAM_BATCH_SIZE):
+    """Запрос одной порции query: limit строк по ключу (date, time, id) после ключа after.
+    model - модель или набор столбцов (table.c), у которого есть date, time и id"""
+    columns = (model.date, model.time, model.id)
+    if after:
+        # Значения курсора привязываются с типами столбцов (дата и время хранятся числами)
+        bound = tuple_(*[literal(value, column.type) for value, column in zip(after, columns)])
+        key = tuple_(*columns)
+        query = query.filter(key < bound if descending else key > bound)
+    return query.order_by(*[column.desc() if descending else column.asc() for column in columns]).limit(limit)
+
+
+def iter_keyset(model, query, after=None, descending=False, batch_size=LIST_STREAM_BATCH_SIZE):
+    """Строки query порциями по ключу (date, time, id) без OFFSET и без загрузки всей выборки"""
+    while True:
+        rows = keyset_page(model, query, after, descending, batch_size).all()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last = rows[-1]
+        after = (last.date, last.time, last.id)
+
+
+def keyset_listing(model, query, items_key, data, serialize, descending=False):
+    """Общий ответ списков: ?from&to - фильтр дат, ?limit&cursor - страница,
+    ?format=ndjson - потоковая выдача всей выборки построчно"""
+    try:
+        date_from = request.args.get('from')
+        date_to = request.args.get('to')
+        for value in (date_from, date_to):
+            if value:
+                date_type.fromisoformat(value)
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+        limit = request.args.get('limit', type=int)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Неверные параметры выборки'}), 400
+
+    if date_from:
+        query = query.filter(model.date >= date_from)
+    if date_to:
+        query = query.filter(model.date <= date_to)
+
+    if request.args.get('format') == 'ndjson':
+        rows = iter_keyset(model, query, after, descending)
+        if limit:
+            rows = islice(rows, limit)
+
+        def generate():
+            for row in rows:
+                yield dumps(serialize(row)) + b'\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    limit = min(max(limit or LIST_PAGE_SIZE, 1), MAX_LIST_PAGE_SIZE)
+    rows = list(islice(iter_keyset(model, query, after, descending, batch_size=limit + 1), limit + 1))
+    page = rows[:limit]
+
+    result = {'success': True}
+    result.update(data)
+    result.update({
+        items_key: [serialize(row) for row in page],
+        'total': len(page),
+        'next_cursor': encode_cursor(page[-1]) if len(rows) > limit else None
+    })
+    return json_response(result)
@@ -23,7 +23,7 @@ def reset_all_services():
     services = [
         ("User_Service", "users.db"),
         ("Master_Service", "masters.db"), 
-        ("Booking_Service", None),
+        ("Booking_Service", "outbox.db"),
         ("Confirmation_Service", "bookings.db")
     ]
     
@@ -35,6 +35,12 @@ def reset_all_services():
                 print(f"   ✅ {service_dir}/{db_file} удален")
             else:
                 print(f"   ⏭ {service_dir}/{db_file} не найден")
+            # Базы в режиме WAL: после taskkill /f незафиксированный журнал
+            # остается рядом и применился бы к новой базе при открытии
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+                    print(f"   ✅ {service_dir}/{db_file}{suffix} удален")
     
     # 3. Перезапускаем сервисы
     print("\n3. Перезапуск сервисов...")
@@ -0,0 +1,75 @@
+import json
+
+from flask import Response
+
+# orjson необязателен: без него используется стандартный json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+
+def dumps(obj):
+    """JSON в bytes самым быстрым доступным кодировщиком"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+def json_response(obj, status=200):
+    """Замена jsonify для больших списков"""
+    return Response(dumps(obj), status=status, mimetype='application/json')
+
+
+def isoformat(value):
+    return value.isoformat() if value is not None else None
+
+
+class RowMapper:
+    """Проекция строк запроса в словари ответа.
+
+    fields - имена столбцов или кортежи (ключ ответа, столбец[, преобразование]).
+    columns(source) возвращает столбцы для with_entities/query, а вызов
+    mapper(row) превращает кортеж результата в словарь функцией, собранной
+    один раз при создании: без getattr, циклов и построения объектов ORM.
+    """
+
+    def __init__(self, *fields):
+        self.fields = [self._normalize(field) for field in fields]
+        self.names = [name for _, name, _ in self.fields]
+        self._map = self._compile()
+
+    @staticmethod
+    def _normalize(field):
+        if isinstance(field, str):
+            return field, field, None
+        key, name, *convert = field
+        return key, name, convert[0] if convert else None
+
+    def _compile(self):
+        namespace = {}
+        values = []
+        for index, (key, _, convert) in enumerate(self.fields):
+            if convert is None:
+                values.append(f'{key!r}: c{index}')
+            else:
+                namespace[f'convert{index}'] = convert
+                values.append(f'{key!r}: convert{index}(c{index})')
+        unpack = ''.join(f'c{index}, ' for index in range(len(self.fields)))
+        source = f'def map_row(row):\n    {unpack} = row\n    return {{{", ".join(values)}}}\n'
+        exec(source, namespace)
+        return namespace['map_row']
+
+    def columns(self, source):
+        """Столбцы в порядке полей; source - модель, таблица или подзапрос"""
+        table = getattr(source, '__table__', source)
+        return [table.c[name] for name in self.names]
+
+    def __call__(self, row):
+        return self._map(row)
+
+    def all(self, rows):
+        map_row = self._map
+        return [map_row(row) for row in rows]
@@ -0,0 +1,171 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+# Адреса сервисов (можно переопределить переменными окружения, например MASTER_SERVICE_URL)
+SERVICE_URLS = {
+    'user': os.environ.get('USER_SERVICE_URL', 'http://localhost:5000'),
+    'master': os.environ.get('MASTER_SERVICE_URL', 'http://localhost:5001'),
+    'booking': os.environ.get('BOOKING_SERVICE_URL', 'http://localhost:5002'),
+    'confirmation': os.environ.get('CONFIRMATION_SERVICE_URL', 'http://localhost:5003'),
+    'history': os.environ.get('HISTORY_SERVICE_URL', 'http://localhost:5004'),
+    'sync': os.environ.get('SYNC_SERVICE_URL', 'ws://localhost:5005')
+}
+
+# Настройки пула соединений, таймаутов и повторов
+HTTP_CLIENT_CONFIG = {
+    'pool_connections': int(os.environ.get('HTTP_POOL_CONNECTIONS', 1)),
+    'pool_maxsize': int(os.environ.get('HTTP_POOL_MAXSIZE', 20)),
+    'connect_timeout': float(os.environ.get('HTTP_CONNECT_TIMEOUT', 1.0)),
+    'read_timeout': float(os.environ.get('HTTP_READ_TIMEOUT', 5.0)),
+    'max_retries': int(os.environ.get('HTTP_MAX_RETRIES', 2)),
+    'backoff_factor': float(os.environ.get('HTTP_BACKOFF_FACTOR', 0.1)),
+    'fanout_workers': int(os.environ.get('HTTP_FANOUT_WORKERS', 16)),
+    'fanout_deadline': float(os.environ.get('HTTP_FANOUT_DEADLINE', 6.0))
+}
+
+# Ответы, при которых повтор имеет смысл (только для идемпотентных методов)
+RETRY_STATUSES = (502, 503, 504)
+
+
+class ServiceClient:
+    """HTTP-клиент одного сервиса с keep-alive пулом соединений"""
+
+    def __init__(self, name, base_url, config=None):
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.config = dict(HTTP_CLIENT_CONFIG, **(config or {}))
+        self.timeout = (self.config['connect_timeout'], self.config['read_timeout'])
+        self.session = self._create_session()
+        self.breaker = None
+
+    def _create_session(self):
+        # Ошибки соединения повторяются для любых методов (запрос еще не отправлен),
+        # 502/503/504 - только для идемпотентных (GET, PUT, DELETE...). Таймаут чтения
+        # не повторяется: зависшая зависимость стоила бы (1 + max_retries) * read_timeout,
+        # а выключатель узнал бы о неудаче только после всех попыток
+        retries = Retry(
+            total=self.config['max_retries'],
+            connect=self.config['max_retries'],
+            read=0,
+            status=self.config['max_retries'],
+            backoff_factor=self.config['backoff_factor'],
+            status_forcelist=RETRY_STATUSES,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=self.config['pool_connections'],
+            pool_maxsize=self.config['pool_maxsize'],
+            max_retries=retries
+        )
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def enable_circuit_breaker(self, config=None):
+        """Включает автоматический выключатель для всех запросов этого клиента"""
+        self.breaker = CircuitBreaker(self.name, config)
+        return self.breaker
+
+    def request(self, method, path, use_breaker=True, **kwargs):
+        """Запрос к сервису; timeout по умолчанию берется из конфигурации.
+
+        Если включен выключатель и цепь разомкнута, сразу бросает CircuitOpenError.
+        Ответы 5xx и сетевые ошибки считаются неудачными вызовами.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        url = f'{self.base_url}{path}'
+        breaker = self.breaker if use_breaker else None
+        if breaker is None:
+            return self.session.request(method, url, **kwargs)
+
+        breaker.before_call()
+        started = time.monotonic()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except Exception:
+            breaker.record(False, time.monotonic() - started)
+            raise
+        breaker.record(response.status_code < 500, time.monotonic() - started)
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name, base_url=None):
+    """Возвращает общий для процесса клиент сервиса (один пул на сервис)"""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = ServiceClient(name, base_url or SERVICE_URLS[name])
+                _clients[name] = client
+    return client
+
+
+_fanout_executor = ThreadPoolExecutor(
+    max_workers=HTTP_CLIENT_CONFIG['fanout_workers'],
+    thread_name_prefix='fanout'
+)
+
+
+def fan_out(calls, deadline=None):
+    """Выполняет независимые вызовы параллельно с общим дедлайном.
+
+    calls - словарь {имя: (функция, *аргументы)}. Возвращает словарь
+    {имя: результат}; для вызовов, упавших с исключением или не успевших
+    к дедлайну, результат None. CircuitOpenError пробрасывается вызывающему,
+    чтобы запрос сразу завершился ответом 503.
+    """
+    if deadline is None:
+        deadline = HTTP_CLIENT_CONFIG['fanout_deadline']
+
+    futures = {
+        name: _fanout_executor.submit(call[0], *call[1:])
+        for name, call in calls.items()
+    }
+    wait(futures.values(), timeout=deadline)
+
+    results = {}
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            logger.warning(f"Fan-out: вызов {name} не уложился в {deadline} с")
+            results[name] = None
+        elif isinstance(future.exception(), CircuitOpenError):
+            raise future.exception()
+        elif future.exception() is not None:
+            logger.error(f"Fan-out: вызов {name} завершился ошибкой: {future.exception()}")
+            results[name] = None
+        else:
+            results[name] = future.result()
+    return results
@@ -0,0 +1,78 @@
+from bisect import bisect_left
+from datetime import date as date_type, timedelta
+
+
+def time_to_minutes(value):
+    """'HH:MM' -> минуты от начала суток"""
+    hours, minutes = value.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def minutes_to_time(minutes):
+    """Минуты от начала суток -> 'HH:MM'"""
+    return f'{minutes // 60:02d}:{minutes % 60:02d}'
+
+
+class SlotIndex:
+    """Свободные слоты мастера по дням в виде отсортированных списков минут"""
+
+    def __init__(self, days=None):
+        self.days = {}
+        if days:
+            self.add_days(days)
+
+    def add_days(self, days):
+        """days - словарь {дата: список свободных времен 'HH:MM'}"""
+        for day, times in days.items():
+            self.days[day] = sorted(time_to_minutes(t) for t in times)
+
+    def nearest(self, day, target, k):
+        """k ближайших к target свободных слотов дня в обе стороны.
+
+        При равном расстоянии предпочитается более позднее время.
+        """
+        free = self.days.get(day)
+        if not free:
+            return []
+
+        hi = bisect_left(free, target)
+        lo = hi - 1
+        result = []
+        while len(result) < k and (lo >= 0 or hi < len(free)):
+            if hi < len(free) and (lo < 0 or free[hi] - target <= target - free[lo]):
+                result.append(free[hi])
+                hi += 1
+            else:
+                result.append(free[lo])
+                lo -= 1
+        return result
+
+
+def find_alternatives(index, day, time, k=3, max_days=7):
+    """Ранжированный список ближайших свободных слотов.
+
+    Сначала ищет в запрошенный день в обе стороны от time, затем идет
+    вперед по дням (не дальше max_days), пока не наберет k вариантов.
+    """
+    target = time_to_minutes(time)
+    start = date_type.fromisoformat(day)
+    suggestions = []
+
+    for offset in range(max_days + 1):
+        current = (start + timedelta(days=offset)).isoformat()
+        for minutes in index.nearest(current, target, k - len(suggestions)):
+            suggestions.append({
+                'date': current,
+                'time': minutes_to_time(minutes),
+                'day_offset': offset,
+                'difference': minutes - target
+            })
+        if len(suggestions) >= k:
+            break
+
+    return suggestions
+
+
+def rank_key(suggestion):
+    """Ключ сортировки: сначала ближе по дням, затем по времени"""
+    return suggestion['day_offset'], abs(suggestion['difference']), suggestion['difference'] < 0
@@ -0,0 +1,59 @@
+import os
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+
+# Настройки SQLite для всех сервисов (можно переопределить переменными окружения)
+SQLITE_CONFIG = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Отрицательное значение - размер в КиБ, а не в страницах
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+    'pool_size': int(os.environ.get('SQLITE_POOL_SIZE', 10)),
+    'max_overflow': int(os.environ.get('SQLITE_MAX_OVERFLOW', 20)),
+    'pool_timeout': float(os.environ.get('SQLITE_POOL_TIMEOUT', 30))
+}
+
+
+def create_sqlite_db(app, db_path, config=None):
+    """SQLAlchemy для файла SQLite с общими настройками пула и PRAGMA.
+
+    WAL позволяет читателям работать параллельно с писателем, а busy_timeout
+    заставляет писателей ждать блокировку вместо ошибки "database is locked".
+    Итоговые настройки доступны в app.config['SQLITE_CONFIG'].
+    """
+    config = dict(SQLITE_CONFIG, **(config or {}))
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': config['pool_size'],
+        'max_overflow': config['max_overflow'],
+        'pool_timeout': config['pool_timeout'],
+        'connect_args': {
+            'timeout': config['busy_timeout'] / 1000,
+            # Соединения пула используются разными потоками запросов
+            'check_same_thread': False
+        }
+    }
+    app.config['SQLITE_CONFIG'] = config
+
+    db = SQLAlchemy(app)
+    with app.app_context():
+        event.listen(db.engine, 'connect', lambda conn, record: apply_pragmas(conn, config))
+    return db
+
+
+def apply_pragmas(dbapi_connection, config):
+    """PRAGMA действуют на соединение, поэтому выполняются при каждом подключении"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={config['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={config['synchronous']}")
+        cursor.execute(f"PRAGMA busy_timeout={int(config['busy_timeout'])}")
+        cursor.execute(f"PRAGMA mmap_size={int(config['mmap_size'])}")
+        cursor.execute(f"PRAGMA cache_size={int(config['cache_size'])}")
+    finally:
+        cursor.close()
+
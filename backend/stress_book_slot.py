@@ -0,0 +1,75 @@
+import argparse
+import sys
+import threading
+import time
+from collections import Counter
+
+import requests
+
+MASTER_URL = 'http://localhost:5001'
+
+
+def stress_book_slot(master_id, date, slot_time, workers):
+    """Одновременно отправляет workers бронирований одного слота"""
+    barrier = threading.Barrier(workers)
+    statuses = Counter()
+    lock = threading.Lock()
+
+    def worker(client_id):
+        session = requests.Session()
+        barrier.wait()
+        try:
+            response = session.post(
+                f'{MASTER_URL}/book_slot/{master_id}/{date}/{slot_time}',
+                json={'client_id': client_id},
+                timeout=30
+            )
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        with lock:
+            statuses[status] += 1
+
+    threads = [threading.Thread(target=worker, args=(i + 1,)) for i in range(workers)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses, time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочная проверка бронирования одного слота')
+    parser.add_argument('--master', type=int, default=1)
+    parser.add_argument('--date', required=True, help='Рабочий день в формате YYYY-MM-DD')
+    parser.add_argument('--time', default='10:00')
+    parser.add_argument('--workers', type=int, default=300)
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print(f"🔥 {args.workers} одновременных бронирований слота "
+          f"мастер={args.master} {args.date} {args.time}")
+    print("=" * 60)
+
+    # Слот должен быть свободен перед проверкой
+    requests.delete(f'{MASTER_URL}/free_slot/{args.master}/{args.date}/{args.time}', timeout=10)
+
+    statuses, elapsed = stress_book_slot(args.master, args.date, args.time, args.workers)
+    print(f"⏱ {elapsed:.2f} с, ответы: {dict(statuses)}")
+
+    schedule = requests.get(f'{MASTER_URL}/schedule/{args.master}/{args.date}', timeout=10).json()
+    booked_count = schedule.get('booked_times', []).count(args.time)
+
+    requests.delete(f'{MASTER_URL}/free_slot/{args.master}/{args.date}/{args.time}', timeout=10)
+
+    ok = statuses[200] == 1 and statuses[409] == args.workers - 1 and booked_count == 1
+    if ok:
+        print("✅ Ровно одно бронирование успешно, остальные получили 409")
+    else:
+        print("❌ Нарушена атомарность бронирования")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+import os
+import sqlite3
+import sys
+
+from flask import Flask
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlite_engine import create_sqlite_db
+from typed_columns import DayNumber, MinuteOfDay, day_number, migrate_typed_columns
+
+
+def legacy_database(path, rows):
+    """Таблица booked_slots старой схемы: дата и время строками, без уникального индекса"""
+    connection = sqlite3.connect(path)
+    connection.execute(
+        'CREATE TABLE booked_slots (id INTEGER NOT NULL, master_id INTEGER NOT NULL, '
+        'date VARCHAR(20) NOT NULL, time VARCHAR(10) NOT NULL, client_id INTEGER NOT NULL, PRIMARY KEY (id))'
+    )
+    connection.executemany('INSERT INTO booked_slots VALUES (?, ?, ?, ?, ?)', rows)
+    connection.commit()
+    connection.close()
+
+
+def migrate(path):
+    app = Flask(__name__)
+    db = create_sqlite_db(app, str(path))
+
+    class BookedSlot(db.Model):
+        __tablename__ = 'booked_slots'
+        __table_args__ = (
+            db.Index('ux_booked_slots_master_date_time', 'master_id', 'date', 'time', unique=True),
+        )
+        id = db.Column(db.Integer, primary_key=True)
+        master_id = db.Column(db.Integer, nullable=False)
+        date = db.Column(DayNumber, nullable=False)
+        time = db.Column(MinuteOfDay, nullable=False)
+        client_id = db.Column(db.Integer, nullable=False)
+
+    with app.app_context():
+        assert migrate_typed_columns(db, BookedSlot)
+        assert not migrate_typed_columns(db, BookedSlot)
+        db.session.remove()
+        db.engine.dispose()
+
+
+def test_mixed_legacy_spellings_of_one_slot_are_quarantined(tmp_path):
+    path = tmp_path / 'masters.db'
+    legacy_database(path, [
+        (1, 1, '2030-01-05', '09:00', 10),
+        (2, 1, '2030-1-5', '9:00', 11),
+        (3, 1, '2030-01-05 00:00:00', '09:00:00', 12),
+        (4, 2, '2030-1-5', '9:00', 13),
+        (5, 1, 'not-a-date', '10:00', 14),
+    ])
+
+    migrate(path)
+
+    connection = sqlite3.connect(path)
+    migrated = connection.execute('SELECT id, master_id, date, time FROM booked_slots ORDER BY id').fetchall()
+    quarantined = connection.execute('SELECT id, date, time, error FROM booked_slots_quarantine ORDER BY id').fetchall()
+    connection.close()
+
+    day = day_number('2030-01-05')
+    assert migrated == [(1, 1, day, 540), (4, 2, day, 540)]
+    assert [(row_id, date, time) for row_id, date, time, _ in quarantined] == [
+        (2, '2030-1-5', '9:00'),
+        (3, '2030-01-05 00:00:00', '09:00:00'),
+        (5, 'not-a-date', '10:00'),
+    ]
+    assert all('дубликат' in error for _, _, _, error in quarantined[:2])
@@ -0,0 +1,211 @@
+import logging
+from datetime import date as date_type, timedelta
+
+from sqlalchemy import Integer, UniqueConstraint, text
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.types import TypeDecorator
+
+logger = logging.getLogger(__name__)
+
+EPOCH = date_type(1970, 1, 1)
+
+
+def day_number(value):
+    """'YYYY-MM-DD' -> номер дня от 1970-01-01"""
+    return (date_type.fromisoformat(value) - EPOCH).days
+
+
+def day_to_iso(number):
+    return (EPOCH + timedelta(days=number)).isoformat()
+
+
+def minute_of_day(value):
+    """'HH:MM' -> минуты от начала суток"""
+    hours, minutes = value.split(':')
+    hours, minutes = int(hours), int(minutes)
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError(f'Неверное время {value}')
+    return hours * 60 + minutes
+
+
+def minute_to_hhmm(number):
+    return f'{number // 60:02d}:{number % 60:02d}'
+
+
+class DayNumber(TypeDecorator):
+    """Дата: в Python строка 'YYYY-MM-DD', в базе INTEGER (номер дня).
+
+    Числа сравниваются и индексируются компактнее строк, а API сервисов
+    и код запросов продолжают работать со строками.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return day_number(str(value))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else day_to_iso(value)
+
+
+class MinuteOfDay(TypeDecorator):
+    """Время: в Python строка 'HH:MM', в базе INTEGER (минуты от начала суток)"""
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None or isinstance(value, int):
+            return value
+        return minute_of_day(str(value))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else minute_to_hhmm(value)
+
+
+def legacy_day_number(value):
+    """Дата старой схемы -> номер дня.
+
+    Кроме 'YYYY-MM-DD' принимает даты без ведущих нулей ('2025-1-5') и
+    с временем после даты ('2025-01-05 10:00:00', '2025-01-05T10:00').
+    """
+    if value is None or isinstance(value, int):
+        return value
+    year, month, day = str(value).strip().replace('T', ' ').split(' ')[0].split('-')
+    return (date_type(int(year), int(month), int(day)) - EPOCH).days
+
+
+def legacy_minute_of_day(value):
+    """Время старой схемы -> минуты: 'HH:MM', 'H:MM' или 'HH:MM:SS'"""
+    if value is None or isinstance(value, int):
+        return value
+    hours, minutes = str(value).strip().split(':')[:2]
+    return minute_of_day(f'{hours}:{minutes}')
+
+
+# Разбор строковых значений старой схемы при миграции
+LEGACY_PARSERS = {
+    DayNumber: legacy_day_number,
+    MinuteOfDay: legacy_minute_of_day
+}
+
+MIGRATION_BATCH_SIZE = 1000
+
+
+def migrate_typed_columns(db, model):
+    """Переводит таблицу модели на типизированные столбцы на месте.
+
+    SQLite не умеет менять тип столбца, поэтому таблица пересоздается:
+    старая переименовывается, создается новая со всеми индексами модели,
+    строки копируются с преобразованием, старая удаляется - в одной
+    транзакции. Значения разбираются в Python: строки, которые разобрать
+    нельзя, не прерывают миграцию, а переносятся как есть в таблицу
+    <имя>_quarantine с текстом ошибки. Туда же попадают строки, которые
+    после разбора совпали с уже перенесенной по уникальному индексу
+    ('2025-1-5' и '2025-01-05') - остается строка с меньшим id. Для уже
+    переведенной таблицы ничего не делает.
+    """
+    table = model.__table__
+    declared = {
+        row[1]: row[2].upper()
+        for row in db.session.execute(text(f'PRAGMA table_info({table.name})'))
+    }
+    legacy = {
+        column.name: LEGACY_PARSERS[type(column.type)]
+        for column in table.columns
+        if type(column.type) in LEGACY_PARSERS and declared.get(column.name, 'INTEGER') != 'INTEGER'
+    }
+    if not legacy:
+        return False
+
+    db.session.commit()
+    legacy_name = f'{table.name}_legacy'
+    quarantine_name = f'{table.name}_quarantine'
+    columns = [column.name for column in table.columns if column.name in declared]
+    parsers = [(index, legacy.get(name), table.c[name].nullable) for index, name in enumerate(columns)]
+    # Уникальные индексы модели: (имена столбцов, позиции в строке, уже перенесенные ключи)
+    unique_keys = [
+        ([column.name for column in unique.columns], [columns.index(column.name) for column in unique.columns], set())
+        for unique in [index for index in table.indexes if index.unique]
+        + [constraint for constraint in table.constraints if isinstance(constraint, UniqueConstraint)]
+        if all(column.name in columns for column in unique.columns)
+    ]
+    order = ', '.join(column.name for column in table.primary_key.columns) or 'rowid'
+    insert = f'INSERT INTO {table.name} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})'
+    migrated = quarantined = 0
+
+    connection = db.engine.raw_connection()
+    driver_connection = connection.driver_connection
+    isolation_level = driver_connection.isolation_level
+    driver_connection.isolation_level = None  # транзакцией управляем сами, включая DDL
+    cursor = driver_connection.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute(f'ALTER TABLE {table.name} RENAME TO {legacy_name}')
+        old_indexes = cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+            (legacy_name,)
+        ).fetchall()
+        for (index_name,) in old_indexes:
+            cursor.execute(f'DROP INDEX {index_name}')
+        cursor.execute(str(CreateTable(table).compile(dialect=db.engine.dialect)))
+        for index in table.indexes:
+            cursor.execute(str(CreateIndex(index).compile(dialect=db.engine.dialect)))
+
+        source = driver_connection.execute(f'SELECT {", ".join(columns)} FROM {legacy_name} ORDER BY {order}')
+        while True:
+            rows = source.fetchmany(MIGRATION_BATCH_SIZE)
+            if not rows:
+                break
+            converted, rejected = [], []
+            for row in rows:
+                values = list(row)
+                try:
+                    for index, parse, nullable in parsers:
+                        if parse is not None:
+                            values[index] = parse(values[index])
+                        if values[index] is None and not nullable:
+                            raise ValueError(f'пустое значение {columns[index]}')
+                    keys = [tuple(values[index] for index in indexes) for _, indexes, _ in unique_keys]
+                    for (names, _, seen), key in zip(unique_keys, keys):
+                        if key in seen:
+                            raise ValueError(f'дубликат по {", ".join(names)}')
+                    for (_, _, seen), key in zip(unique_keys, keys):
+                        seen.add(key)
+                except ValueError as e:
+                    rejected.append(tuple(row) + (str(e) or type(e).__name__,))
+                else:
+                    converted.append(values)
+            cursor.executemany(insert, converted)
+            if rejected:
+                if not quarantined:
+                    cursor.execute(
+                        f'CREATE TABLE IF NOT EXISTS {quarantine_name} ({", ".join(columns)}, error TEXT)'
+                    )
+                cursor.executemany(
+                    f'INSERT INTO {quarantine_name} VALUES ({", ".join("?" for _ in range(len(columns) + 1))})',
+                    rejected
+                )
+                for values in rejected:
+                    logger.warning(f"{table.name}: строка {dict(zip(columns, values))} перенесена в {quarantine_name}: {values[-1]}")
+            migrated += len(converted)
+            quarantined += len(rejected)
+        source.close()
+
+        cursor.execute(f'DROP TABLE {legacy_name}')
+        cursor.execute('COMMIT')
+    except Exception:
+        cursor.execute('ROLLBACK')
+        raise
+    finally:
+        cursor.close()
+        driver_connection.isolation_level = isolation_level
+        connection.close()
+
+    logger.info(f"{table.name}: столбцы {', '.join(legacy)} переведены в INTEGER, строк: {migrated}")
+    if quarantined:
+        logger.warning(f"{table.name}: {quarantined} строк не перенесено, они в {quarantine_name}")
+    return True